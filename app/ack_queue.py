@@ -0,0 +1,147 @@
+"""
+Background acknowledgement of Google Play subscriptions
+
+Verify requests only record a row in the play_ack_outbox table (in the same
+transaction as the license write). This worker drains the outbox, so the
+acknowledge round trip never sits on the user-facing path, and pending
+acknowledgements survive restarts.
+"""
+
+import asyncio
+import os
+import random
+from typing import Optional
+
+from .log import get_logger
+from .play_client import acknowledge_subscription, play_error_message
+from .pool import connection, execute
+
+ACK_POLL_INTERVAL = float(os.getenv("ACK_POLL_INTERVAL", "30"))
+ACK_BATCH_SIZE = int(os.getenv("ACK_BATCH_SIZE", "20"))
+ACK_BASE_BACKOFF = float(os.getenv("ACK_BASE_BACKOFF", "5"))
+ACK_MAX_BACKOFF = float(os.getenv("ACK_MAX_BACKOFF", "3600"))
+# Claimed rows become due again after this long if the worker never reports back
+ACK_CLAIM_LEASE = float(os.getenv("ACK_CLAIM_LEASE", "120"))
+
+logger = get_logger("ack_queue")
+
+_wakeup: Optional[asyncio.Event] = None
+
+stats = {
+    "acknowledged": 0,
+    "already_acknowledged": 0,
+    "dropped": 0,
+    "retried": 0,
+}
+
+
+def notify():
+    """Wake the worker after new rows were committed"""
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+def backoff_seconds(attempts: int) -> float:
+    """Exponential backoff with full jitter"""
+    return random.uniform(ACK_BASE_BACKOFF, min(ACK_MAX_BACKOFF, ACK_BASE_BACKOFF * 2 ** attempts))
+
+
+async def _acknowledge(row: dict) -> Optional[str]:
+    """Acknowledge one row; returns an error message if it should be retried"""
+    try:
+        response = await acknowledge_subscription(row["product_id"], row["purchase_token"])
+    except Exception as e:
+        return str(e)
+
+    if response.status_code in (200, 204):
+        stats["acknowledged"] += 1
+    elif response.status_code == 400:
+        # Google answers 400 for tokens that are already acknowledged
+        stats["already_acknowledged"] += 1
+    elif response.status_code in (404, 410):
+        # Unknown, canceled or refunded purchase - nothing left to acknowledge
+        stats["dropped"] += 1
+    else:
+        return f"{response.status_code}: {play_error_message(response)}"
+    return None
+
+
+async def process_due() -> int:
+    """Acknowledge one batch of due rows; returns how many were processed"""
+    # Claim the rows by pushing next_attempt_at past the Play calls, then
+    # commit: no connection or row lock is held while Google is called. A
+    # worker that dies mid-batch leaves them due again after the lease.
+    async with connection() as conn:
+        # SKIP LOCKED lets several API workers claim side by side
+        cur = await execute(
+            conn,
+            "ack_outbox_claim",
+            """
+            UPDATE play_ack_outbox
+            SET next_attempt_at = (NOW() AT TIME ZONE 'utc') + make_interval(secs => %s)
+            WHERE id IN (
+                SELECT id FROM play_ack_outbox
+                WHERE next_attempt_at <= (NOW() AT TIME ZONE 'utc')
+                ORDER BY next_attempt_at
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, product_id, purchase_token, attempts
+            """,
+            (ACK_CLAIM_LEASE, ACK_BATCH_SIZE)
+        )
+        rows = await cur.fetchall()
+    if not rows:
+        return 0
+
+    errors = await asyncio.gather(*(_acknowledge(row) for row in rows))
+
+    done = [row["id"] for row, error in zip(rows, errors) if error is None]
+    failed = [(row, error) for row, error in zip(rows, errors) if error is not None]
+    stats["retried"] += len(failed)
+
+    async with connection() as conn:
+        if done:
+            await execute(conn, "ack_outbox_delete", "DELETE FROM play_ack_outbox WHERE id = ANY(%s)", (done,))
+        if failed:
+            await execute(
+                conn,
+                "ack_outbox_retry",
+                """
+                UPDATE play_ack_outbox AS o
+                SET attempts = o.attempts + 1,
+                    last_error = f.error,
+                    next_attempt_at = (NOW() AT TIME ZONE 'utc') + make_interval(secs => f.delay)
+                FROM unnest(%s::bigint[], %s::text[], %s::float8[]) AS f(id, error, delay)
+                WHERE o.id = f.id
+                """,
+                (
+                    [row["id"] for row, _ in failed],
+                    [error[:500] for _, error in failed],
+                    [backoff_seconds(row["attempts"]) for row, _ in failed],
+                )
+            )
+
+    return len(rows)
+
+
+async def run_ack_worker():
+    """Drain the outbox until cancelled (started from the FastAPI lifespan)"""
+    global _wakeup
+    _wakeup = asyncio.Event()
+
+    while True:
+        _wakeup.clear()
+        try:
+            # Keep going while full batches come back
+            while await process_due() >= ACK_BATCH_SIZE:
+                pass
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Ack worker error")
+
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=ACK_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
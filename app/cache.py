@@ -0,0 +1,391 @@
+"""
+TTL + LRU caches, optionally shared between worker processes through Redis
+"""
+
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from threading import Lock
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional
+
+from .log import get_logger
+
+# redis://host:port/db shared by every worker; unset keeps caches per process
+SHARED_CACHE_URL = os.getenv("SHARED_CACHE_URL")
+SHARED_CACHE_PREFIX = os.getenv("SHARED_CACHE_PREFIX", "prostack")
+# How long a worker may serve a Redis entry from memory (invalidations are
+# broadcast, so this only bounds staleness if a broadcast is missed)
+SHARED_CACHE_L1_TTL = float(os.getenv("SHARED_CACHE_L1_TTL", "5"))
+
+INVALIDATION_CHANNEL = f"{SHARED_CACHE_PREFIX}:cache:invalidate"
+
+logger = get_logger("cache")
+
+
+class TTLCache:
+    """
+    Bounded cache where entries expire after `ttl` seconds and the least
+    recently used entry is evicted once `maxsize` is reached.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, name: str = "cache"):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value or `default` when missing/expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Store a value, evicting the least recently used entry if full"""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> bool:
+        """Drop a single entry (write-through invalidation)"""
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self.invalidations += 1
+                return True
+            return False
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drop every entry whose key matches `predicate`"""
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                del self._data[key]
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """Counters used to size the cache"""
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+# ==================== Shared Cache ====================
+
+# Sentinel stored for devices without a license row, so repeated polls from
+# unknown devices don't hit Postgres either
+NO_LICENSE = object()
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    raise TypeError(f"Cannot cache {type(value).__name__}")
+
+
+def _json_object(obj: dict):
+    if "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    if "__no_license__" in obj:
+        return NO_LICENSE
+    return obj
+
+
+def encode_value(value: Any) -> str:
+    if value is NO_LICENSE:
+        return '{"__no_license__": true}'
+    return json.dumps(value, default=_json_default)
+
+
+def decode_value(raw) -> Any:
+    return json.loads(raw, object_hook=_json_object)
+
+
+class SharedCache:
+    """
+    Async cache API over a pluggable backend.
+
+    By default this is a per-process TTLCache. Once open_shared_caches() has
+    connected to SHARED_CACHE_URL, entries live in Redis where every worker
+    sees them, with the TTLCache kept as a short-lived L1 in front. Writes
+    invalidate Redis and broadcast the keys so other workers drop their L1
+    copy. Redis errors degrade to a miss; callers fall back to the source.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, name: str):
+        self.name = name
+        self.ttl = ttl
+        self.local = TTLCache(maxsize, ttl, name)
+        self.redis = None
+        self.remote_hits = 0
+        self.remote_misses = 0
+        self.remote_errors = 0
+
+    def _remote_key(self, key: Hashable) -> str:
+        parts = key if isinstance(key, tuple) else (key,)
+        return ":".join([SHARED_CACHE_PREFIX, self.name, *map(str, parts)])
+
+    async def get(self, key: Hashable, default: Any = None) -> Any:
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        if self.redis is None:
+            return default
+
+        try:
+            raw = await self.redis.get(self._remote_key(key))
+        except Exception:
+            self.remote_errors += 1
+            logger.warning("Shared cache read failed", extra={"fields": {"cache": self.name}})
+            return default
+
+        if raw is None:
+            self.remote_misses += 1
+            return default
+
+        self.remote_hits += 1
+        value = decode_value(raw)
+        self.local.set(key, value, ttl=SHARED_CACHE_L1_TTL)
+        return value
+
+    async def get_many(self, keys: Iterable[Hashable]) -> Dict[Hashable, Any]:
+        """Cached values for the keys that have one (one MGET for L1 misses)"""
+        found = {}
+        missing = []
+        for key in keys:
+            value = self.local.get(key)
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+
+        if not missing or self.redis is None:
+            return found
+
+        try:
+            raws = await self.redis.mget([self._remote_key(key) for key in missing])
+        except Exception:
+            self.remote_errors += 1
+            logger.warning("Shared cache read failed", extra={"fields": {"cache": self.name}})
+            return found
+
+        for key, raw in zip(missing, raws):
+            if raw is None:
+                self.remote_misses += 1
+                continue
+            self.remote_hits += 1
+            found[key] = decode_value(raw)
+            self.local.set(key, found[key], ttl=SHARED_CACHE_L1_TTL)
+        return found
+
+    async def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if self.redis is None:
+            self.local.set(key, value, ttl=ttl)
+            return
+
+        self.local.set(key, value, ttl=min(ttl, SHARED_CACHE_L1_TTL))
+        try:
+            await self.redis.set(self._remote_key(key), encode_value(value), px=max(1, int(ttl * 1000)))
+        except Exception:
+            self.remote_errors += 1
+            logger.warning("Shared cache write failed", extra={"fields": {"cache": self.name}})
+
+    async def invalidate(self, key: Hashable) -> int:
+        return await self.invalidate_many([key])
+
+    async def invalidate_many(self, keys: Iterable[Hashable]) -> int:
+        """Drop entries everywhere (write-through invalidation); returns how many existed"""
+        keys = list(keys)
+        if not keys:
+            return 0
+
+        existed = sum(self.local.invalidate(key) for key in keys)
+        if self.redis is None:
+            return existed
+
+        message = json.dumps({"cache": self.name, "keys": keys})
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.delete(*[self._remote_key(key) for key in keys])
+                pipe.publish(INVALIDATION_CHANNEL, message)
+                deleted, _ = await pipe.execute()
+            return deleted
+        except Exception:
+            self.remote_errors += 1
+            logger.warning("Shared cache invalidation failed", extra={"fields": {"cache": self.name}})
+            return existed
+
+    def stats(self) -> dict:
+        stats = self.local.stats()
+        if self.redis is None:
+            return {**stats, "backend": "local"}
+
+        hits = self.local.hits + self.remote_hits
+        lookups = hits + self.remote_misses
+        return {
+            **stats,
+            "backend": "redis",
+            "l1_hits": self.local.hits,
+            "hits": hits,
+            "misses": self.remote_misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else None,
+            "remote_errors": self.remote_errors,
+        }
+
+
+_shared_caches: Dict[str, SharedCache] = {}
+_redis = None
+_listener: Optional[asyncio.Task] = None
+
+
+def _register(cache: SharedCache) -> SharedCache:
+    _shared_caches[cache.name] = cache
+    return cache
+
+
+async def _listen_for_invalidations():
+    """Drop L1 entries that another worker invalidated"""
+    while True:
+        try:
+            async with _redis.pubsub() as pubsub:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Broadcasts may have been missed while disconnected
+                for cache in _shared_caches.values():
+                    cache.local.clear()
+
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    data = json.loads(message["data"])
+                    cache = _shared_caches.get(data["cache"])
+                    if cache is None:
+                        continue
+                    for key in data["keys"]:
+                        cache.local.invalidate(tuple(key) if isinstance(key, list) else key)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Cache invalidation listener failed, reconnecting")
+            await asyncio.sleep(1)
+
+
+async def open_shared_caches():
+    """Connect the caches to SHARED_CACHE_URL (called from the FastAPI lifespan)"""
+    global _redis, _listener
+
+    if not SHARED_CACHE_URL or _redis is not None:
+        return
+
+    # Optional dependency, only needed when a shared backend is configured
+    import redis.asyncio as redis
+
+    _redis = redis.from_url(SHARED_CACHE_URL)
+    await _redis.ping()
+    for cache in _shared_caches.values():
+        cache.redis = _redis
+    _listener = asyncio.create_task(_listen_for_invalidations())
+
+
+def shared_redis():
+    """The Redis client opened for the shared caches, or None"""
+    return _redis
+
+
+async def close_shared_caches():
+    global _redis, _listener
+
+    if _listener is not None:
+        _listener.cancel()
+        _listener = None
+    if _redis is not None:
+        for cache in _shared_caches.values():
+            cache.redis = None
+        await _redis.aclose()
+        _redis = None
+
+
+# ==================== Shared Instances ====================
+
+# device_id -> license row (dict) or NO_LICENSE
+license_cache = _register(SharedCache(
+    maxsize=int(os.getenv("LICENSE_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("LICENSE_CACHE_TTL", "300")),
+    name="license",
+))
+
+# (product_id, purchase_token) -> verify_google_play_purchase result.
+# Entries live until the subscription's expiryTimeMillis, capped by the TTL.
+verification_cache = _register(SharedCache(
+    maxsize=int(os.getenv("VERIFICATION_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("VERIFICATION_CACHE_MAX_TTL", "3600")),
+    name="verification",
+))
+
+
+async def cache_verification(product_id: str, purchase_token: str, result: dict, expiry_time_millis: int):
+    """Cache an active verification until the subscription could next change"""
+    if not result.get("valid") or not result.get("is_active"):
+        return
+
+    ttl = expiry_time_millis / 1000 - time.time()
+    if ttl > 0:
+        await verification_cache.set((product_id, purchase_token), result, ttl=ttl)
+
+
+async def invalidate_verification(purchase_token: str, product_id: Optional[str] = None) -> int:
+    """Forget cached verifications for a token (all products unless given)"""
+    if product_id is not None:
+        return await verification_cache.invalidate((product_id, purchase_token))
+
+    invalidated = verification_cache.local.invalidate_where(lambda key: key[1] == purchase_token)
+    if verification_cache.redis is None:
+        return invalidated
+
+    # Redis keys can't be matched by token cheaply; the product list is short
+    from .play_client import TIER_MAP
+    return await verification_cache.invalidate_many([(product, purchase_token) for product in TIER_MAP])
@@ -0,0 +1,119 @@
+"""
+Circuit breaker for upstream calls
+"""
+
+import time
+from typing import Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open"""
+
+
+class CircuitBreaker:
+    """
+    Stop calling an upstream after `failure_threshold` consecutive failures.
+
+    Calls slower than `slow_call_threshold` seconds count as failures too.
+    Once open, calls fail fast with CircuitOpenError for `reset_timeout`
+    seconds; then up to `half_open_max_calls` probes are let through. A
+    successful probe closes the circuit, a failed one opens it again.
+
+    Usage:
+        breaker.before_call()       # raises CircuitOpenError
+        ...
+        breaker.record(failed, elapsed)   # failed=None: outcome unknown (cancelled)
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int,
+        reset_timeout: float,
+        half_open_max_calls: int = 1,
+        slow_call_threshold: Optional[float] = None,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.slow_call_threshold = slow_call_threshold
+
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+
+        self.opened_count = 0
+        self.rejected = 0
+        self.failures = 0
+        self.slow_calls = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probes_in_flight = 0
+        return self._state
+
+    def is_open(self) -> bool:
+        """True while calls would be rejected (not once probing may start)"""
+        state = self.state
+        return state == OPEN or (state == HALF_OPEN and self._probes_in_flight >= self.half_open_max_calls)
+
+    def before_call(self):
+        state = self.state
+        if state == OPEN:
+            self.rejected += 1
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        if state == HALF_OPEN:
+            if self._probes_in_flight >= self.half_open_max_calls:
+                self.rejected += 1
+                raise CircuitOpenError(f"{self.name} circuit is half-open, probe in flight")
+            self._probes_in_flight += 1
+
+    def record(self, failed: Optional[bool], elapsed: float):
+        probing = self._state == HALF_OPEN
+        if probing:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+        if failed is None:
+            return
+
+        if not failed and self.slow_call_threshold is not None and elapsed > self.slow_call_threshold:
+            self.slow_calls += 1
+            failed = True
+
+        if failed:
+            self.failures += 1
+            self._consecutive_failures += 1
+            if probing or self._consecutive_failures >= self.failure_threshold:
+                self._open()
+        else:
+            self._consecutive_failures = 0
+            if probing:
+                self._state = CLOSED
+
+    def _open(self):
+        if self._state != OPEN:
+            self.opened_count += 1
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._probes_in_flight = 0
+
+    def stats(self) -> dict:
+        state = self.state
+        return {
+            "name": self.name,
+            "state": state,
+            "open": int(state != CLOSED),
+            "consecutive_failures": self._consecutive_failures,
+            "opened_count": self.opened_count,
+            "rejected": self.rejected,
+            "failures": self.failures,
+            "slow_calls": self.slow_calls,
+        }
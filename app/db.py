@@ -1,5 +1,12 @@
 from sqlmodel import create_engine, SQLModel, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine
 import os
+import time
+from functools import lru_cache
+
+from .metrics import DB_QUERY_DURATION
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
@@ -7,11 +14,58 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
-engine = create_engine(DATABASE_URL, echo=True)
+# Async driver (psycopg 3) for the request path
+ASYNC_DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+psycopg://", 1)
+
+# Async pool sizing (per process)
+SQLA_POOL_SIZE = int(os.getenv("SQLA_POOL_SIZE", "5"))
+SQLA_MAX_OVERFLOW = int(os.getenv("SQLA_MAX_OVERFLOW", "5"))
+SQLA_POOL_TIMEOUT = float(os.getenv("SQLA_POOL_TIMEOUT", "5"))
+SQLA_POOL_RECYCLE = int(os.getenv("SQLA_POOL_RECYCLE", "1800"))
+
+
+@lru_cache(maxsize=None)
+def get_engine():
+    """
+    Sync engine (psycopg2) for scripts and create_all. Built on first use so
+    the API process never imports psycopg2.
+    """
+    # SQL statement logging goes through app/log.py (SQL_LOG_LEVEL=INFO), not echo
+    return create_engine(DATABASE_URL)
+
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=SQLA_POOL_SIZE,
+    max_overflow=SQLA_MAX_OVERFLOW,
+    pool_timeout=SQLA_POOL_TIMEOUT,
+    pool_recycle=SQLA_POOL_RECYCLE,
+    pool_pre_ping=True,
+)
+
+@event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    context._query_start = time.perf_counter()
+
+@event.listens_for(async_engine.sync_engine, "after_cursor_execute")
+def _observe_query_time(conn, cursor, statement, parameters, context, executemany):
+    DB_QUERY_DURATION.labels("orm").observe(time.perf_counter() - context._query_start)
 
 def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+    SQLModel.metadata.create_all(get_engine())
 
 def get_session():
-    with Session(engine) as session:
-        yield session
\ No newline at end of file
+    with Session(get_engine()) as session:
+        yield session
+
+def new_async_session() -> AsyncSession:
+    # expire_on_commit=False so handlers can read attributes after commit
+    # without an implicit (blocking) refresh
+    return AsyncSession(async_engine, expire_on_commit=False)
+
+async def get_async_session():
+    async with new_async_session() as session:
+        yield session
+
+async def close_async_engine():
+    await async_engine.dispose()
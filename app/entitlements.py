@@ -0,0 +1,167 @@
+"""
+Last known entitlements from the licenses table
+
+Used when Google Play can't give a timely answer: while the Play circuit
+breaker is open, when Play fails with 5xx / 429 / timeouts, or when it is
+slower than PLAY_STALE_AFTER. Such answers are marked `stale`; a slow Play
+call keeps running in the background and its result is written back to the
+license row (stale-while-revalidate).
+"""
+
+import asyncio
+import os
+from datetime import datetime
+from typing import Awaitable, Callable, Optional, Set
+
+from .cache import license_cache
+from .log import get_logger
+from .play_client import play_breaker
+from .pool import connection, execute
+
+# Serve the stored entitlement if Play hasn't answered within this many seconds
+PLAY_STALE_AFTER = float(os.getenv("PLAY_STALE_AFTER", "2"))
+
+logger = get_logger("entitlements")
+
+stats = {
+    "stale_served": 0,
+    "revalidated": 0,
+    "revalidation_failed": 0,
+}
+
+# Keeps background revalidations referenced until they finish
+_background: Set[asyncio.Task] = set()
+
+
+async def stored_entitlement(product_id: str, purchase_token: str, notified_only: bool = False) -> Optional[dict]:
+    """
+    Entitlement for a purchase token as stored in licenses, in the shape of
+    a Play verification result. notified_only restricts it to rows kept
+    current by real-time developer notifications.
+    """
+    if notified_only:
+        query_name = "license_by_token_rtdn"
+        condition = "AND last_notification_at IS NOT NULL ORDER BY last_notification_at DESC"
+    else:
+        query_name = "license_by_token"
+        condition = "ORDER BY updated_at DESC"
+
+    async with connection() as conn:
+        cur = await execute(
+            conn,
+            query_name,
+            f"""
+            SELECT is_active, expires_at FROM licenses
+            WHERE iap_purchase_token = %s AND iap_product_id = %s
+            {condition}
+            LIMIT 1
+            """,
+            (purchase_token, product_id)
+        )
+        row = await cur.fetchone()
+
+    if row is None:
+        return None
+
+    expires_at = row["expires_at"]
+    return {
+        "valid": True,
+        "is_active": bool(row["is_active"]) and (expires_at is None or expires_at > datetime.now()),
+        "expiry_date": expires_at.isoformat() if expires_at else None,
+        "source": "rtdn" if notified_only else "last_known",
+    }
+
+
+async def _stale_entitlement(product_id: str, purchase_token: str) -> Optional[dict]:
+    try:
+        stored = await stored_entitlement(product_id, purchase_token)
+    except Exception:
+        logger.exception("Stored entitlement lookup failed")
+        return None
+
+    if stored is None:
+        return None
+    stats["stale_served"] += 1
+    return {**stored, "stale": True}
+
+
+async def verify_with_fallback(
+    product_id: str,
+    purchase_token: str,
+    fetch: Callable[[], Awaitable[dict]],
+) -> dict:
+    """
+    Run a Play verification (`fetch`), falling back to the stored entitlement.
+
+    fetch() results carry `retryable: True` when the failure was on Google's
+    side; only those, an open circuit or a slow call fall back. Purchases we
+    have never stored still wait for (or fail with) Google. A slow call's
+    result is written back only if it is `definitive` (200, 404, 410).
+    """
+    if play_breaker.is_open():
+        stale = await _stale_entitlement(product_id, purchase_token)
+        if stale is not None:
+            return stale
+
+    task = asyncio.ensure_future(fetch())
+    try:
+        result = await asyncio.wait_for(asyncio.shield(task), PLAY_STALE_AFTER)
+    except asyncio.TimeoutError:
+        stale = await _stale_entitlement(product_id, purchase_token)
+        if stale is None:
+            return await task
+        _background.add(task)
+        task.add_done_callback(lambda t: _revalidated(product_id, purchase_token, t))
+        return stale
+
+    if result.get("retryable"):
+        stale = await _stale_entitlement(product_id, purchase_token)
+        if stale is not None:
+            return stale
+    return result
+
+
+def _revalidated(product_id: str, purchase_token: str, task: asyncio.Task):
+    _background.discard(task)
+    # Only answers that settle the purchase are persisted: a 401/403 from our
+    # own credentials must not downgrade everyone holding the token
+    if task.cancelled() or task.exception() is not None or not task.result().get("definitive"):
+        stats["revalidation_failed"] += 1
+        return
+
+    record = asyncio.ensure_future(record_verification(product_id, purchase_token, task.result()))
+    _background.add(record)
+    record.add_done_callback(_background.discard)
+
+
+async def record_verification(product_id: str, purchase_token: str, result: dict):
+    """Write a definitive Play answer back to the licenses holding the token"""
+    is_active = bool(result.get("valid") and result.get("is_active"))
+    expiry_date = result.get("expiry_date")
+    expires_at = datetime.fromisoformat(expiry_date) if expiry_date else None
+
+    try:
+        async with connection() as conn:
+            cur = await execute(
+                conn,
+                "license_revalidate",
+                """
+                UPDATE licenses SET
+                    is_active = %s,
+                    tier = CASE WHEN %s THEN tier ELSE 'free' END,
+                    expires_at = COALESCE(%s, expires_at),
+                    last_verified = NOW(),
+                    updated_at = NOW()
+                WHERE iap_purchase_token = %s AND iap_product_id = %s
+                RETURNING device_id
+                """,
+                (is_active, is_active, expires_at, purchase_token, product_id)
+            )
+            rows = await cur.fetchall()
+    except Exception:
+        stats["revalidation_failed"] += 1
+        logger.exception("Recording background revalidation failed")
+        return
+
+    stats["revalidated"] += 1
+    await license_cache.invalidate_many(row["device_id"] for row in rows if row["device_id"])
@@ -0,0 +1,138 @@
+"""
+Process-wide Google service-account access token manager
+"""
+
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from .log import get_logger
+
+logger = get_logger("google_auth")
+
+ANDROIDPUBLISHER_SCOPE = "https://www.googleapis.com/auth/androidpublisher"
+
+# Start a background refresh this long before the token expires
+TOKEN_REFRESH_MARGIN = float(os.getenv("GOOGLE_TOKEN_REFRESH_MARGIN", "300"))
+# Never hand out a token with less than this many seconds left
+TOKEN_EXPIRY_SKEW = float(os.getenv("GOOGLE_TOKEN_EXPIRY_SKEW", "60"))
+
+
+class TokenUnavailableError(Exception):
+    """Raised when no usable access token can be obtained"""
+
+
+class GoogleTokenManager:
+    """
+    Parses the service account once and caches its OAuth access token.
+
+    Callers get the cached token until it is close to expiry. Inside the
+    refresh margin the current token is still returned while a single
+    background task fetches the next one; only when the token is unusable
+    do callers wait, and then they all wait on the same refresh.
+    """
+
+    def __init__(self, service_account_json: Optional[str], scopes: list):
+        self._service_account_json = service_account_json
+        self._scopes = scopes
+        self._credentials = None
+        self._token: Optional[str] = None
+        self._expiry: Optional[datetime] = None  # naive UTC, as google-auth uses
+        self._lock: Optional[asyncio.Lock] = None
+        self._background: Optional[asyncio.Task] = None
+        self.refresh_count = 0
+        self.refresh_errors = 0
+
+    @property
+    def configured(self) -> bool:
+        return bool(self._service_account_json)
+
+    def _load_credentials(self):
+        if self._credentials is None:
+            if not self._service_account_json:
+                raise TokenUnavailableError("GOOGLE_SERVICE_ACCOUNT_JSON not set")
+            # google-auth pulls in cryptography and requests; import on first use
+            from google.oauth2 import service_account
+
+            info = json.loads(self._service_account_json)
+            self._credentials = service_account.Credentials.from_service_account_info(
+                info, scopes=self._scopes
+            )
+        return self._credentials
+
+    def _seconds_left(self) -> float:
+        if not self._token or not self._expiry:
+            return 0
+        return (self._expiry - datetime.utcnow()).total_seconds()
+
+    async def get_token(self) -> str:
+        """Return a valid access token, refreshing only when needed"""
+        remaining = self._seconds_left()
+
+        if remaining > TOKEN_EXPIRY_SKEW:
+            if remaining < TOKEN_REFRESH_MARGIN:
+                self._refresh_in_background()
+            return self._token
+
+        await self._refresh()
+        if self._seconds_left() <= 0:
+            raise TokenUnavailableError("Could not obtain Google access token")
+        return self._token
+
+    def warm_up(self):
+        """Fetch the first token in the background so the first verify doesn't wait"""
+        if self.configured:
+            self._refresh_in_background()
+
+    def _refresh_in_background(self):
+        if self._background is None or self._background.done():
+            self._background = asyncio.create_task(self._refresh_quietly())
+
+    async def _refresh_quietly(self):
+        try:
+            await self._refresh()
+        except Exception:
+            logger.exception("Background Google token refresh failed")
+
+    async def _refresh(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            # Another caller may have refreshed while we waited for the lock
+            if self._seconds_left() >= TOKEN_REFRESH_MARGIN:
+                return
+
+            try:
+                # Loading the key and the refresh itself block - keep them off the loop
+                credentials = await asyncio.to_thread(self._refresh_sync)
+            except Exception:
+                self.refresh_errors += 1
+                raise
+
+            self.refresh_count += 1
+            self._token = credentials.token
+            self._expiry = credentials.expiry or datetime.utcnow() + timedelta(hours=1)
+
+    def _refresh_sync(self):
+        from google.auth.transport.requests import Request
+
+        credentials = self._load_credentials()
+        credentials.refresh(Request())
+        return credentials
+
+    def stats(self) -> dict:
+        return {
+            "configured": self.configured,
+            "seconds_left": round(self._seconds_left()),
+            "refresh_count": self.refresh_count,
+            "refresh_errors": self.refresh_errors,
+        }
+
+
+play_token_manager = GoogleTokenManager(
+    os.getenv("GOOGLE_SERVICE_ACCOUNT_JSON"),
+    scopes=[ANDROIDPUBLISHER_SCOPE],
+)
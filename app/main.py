@@ -2,30 +2,76 @@
 ProStack Backend with Database License Management
 """
 
-from fastapi import FastAPI, HTTPException, Header
+from fastapi import FastAPI, HTTPException, Header, Request as FastAPIRequest
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse, Response
+from prometheus_client import REGISTRY, CONTENT_TYPE_LATEST, generate_latest
 from contextlib import asynccontextmanager
 
-from .db import create_db_and_tables
+from .db import close_async_engine
+from .log import setup_logging, shutdown_logging, get_logger, RequestIdMiddleware
+from .pool import open_pool, close_pool, connection, execute, pool_stats
+from .metrics import DB_QUERY_DURATION, MetricsMiddleware, StatsCollector, scrape_registry
+from .cache import (
+    license_cache,
+    NO_LICENSE,
+    verification_cache,
+    cache_verification,
+    invalidate_verification,
+    open_shared_caches,
+    close_shared_caches,
+)
+from .google_auth import play_token_manager
+from .singleflight import SingleFlight
+from .play_client import (
+    open_play_client,
+    close_play_client,
+    get_subscription,
+    pool_stats as play_pool_stats,
+    TIER_MAP,
+    is_upstream_failure,
+    play_breaker,
+)
+from .circuit import CircuitOpenError
+from .entitlements import verify_with_fallback, stats as entitlement_stats
+from .ack_queue import run_ack_worker, stats as ack_stats
+from .sweeper import run_expiry_sweeper, stats as sweeper_stats
+from . import rtdn
+from .ratelimit import RateLimitMiddleware, stats as ratelimit_stats
 from .routers import iap
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import AsyncIterator, Dict, List, Optional
+import asyncio
+import orjson
 import os
+import time
 from datetime import datetime
-import psycopg2
-from psycopg2.extras import RealDictCursor
-import json
-import httpx
-from google.oauth2 import service_account
-from google.auth.transport.requests import Request
+from psycopg_pool import PoolTimeout
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Create tables on startup
-    create_db_and_tables()
+    # Schema is managed by Alembic (`alembic upgrade head` runs before the server starts)
+    await open_pool()
+    await open_shared_caches()
+    open_play_client()
+    # First Google token is fetched in the background, not on the first verify
+    play_token_manager.warm_up()
+    ack_worker = asyncio.create_task(run_ack_worker())
+    expiry_sweeper = asyncio.create_task(run_expiry_sweeper())
     yield
+    expiry_sweeper.cancel()
+    ack_worker.cancel()
+    await close_play_client()
+    await close_shared_caches()
+    await close_async_engine()
+    await close_pool()
+    shutdown_logging()
+
+setup_logging()
+logger = get_logger("main")
 
-app = FastAPI(title="ProStack API", lifespan=lifespan)
+# orjson instead of the stdlib encoder for every response
+app = FastAPI(title="ProStack API", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # CORS
 app.add_middleware(
@@ -36,297 +82,440 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Include routers
+# Token buckets per API key / device / purchase token, ahead of any DB or Play work
+app.add_middleware(RateLimitMiddleware)
+
+# Correlation ID for every log line of a request
+app.add_middleware(RequestIdMiddleware)
+
+# Per-route latency histograms
+app.add_middleware(MetricsMiddleware)
+
+# Include routers (iap serves /api/v1/subscriptions/verify)
 app.include_router(iap.router)
 
+
+@app.exception_handler(PoolTimeout)
+async def pool_timeout_handler(request: FastAPIRequest, exc: PoolTimeout):
+    """No database connection became free in time - ask the client to retry"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Database busy, please retry"},
+        headers={"Retry-After": "1"},
+    )
+
 # Configuration
 PROSTACK_API_KEY = os.getenv("PROSTACK_API_KEY")
 DATABASE_URL = os.getenv("DATABASE_URL")  # Railway provides this automatically
-GOOGLE_PLAY_PACKAGE_NAME = "com.fourdgamimg.prostack"
-GOOGLE_SERVICE_ACCOUNT_JSON = os.getenv("GOOGLE_SERVICE_ACCOUNT_JSON")
 
-# Database connection
-def get_db():
-    """Get database connection"""
-    conn = psycopg2.connect(DATABASE_URL)
-    return conn
+# Bulk re-verification
+BULK_VERIFY_CONCURRENCY = int(os.getenv("BULK_VERIFY_CONCURRENCY", "8"))
+BULK_VERIFY_MAX_CONCURRENCY = int(os.getenv("BULK_VERIFY_MAX_CONCURRENCY", "32"))
+BULK_VERIFY_BATCH_SIZE = int(os.getenv("BULK_VERIFY_BATCH_SIZE", "100"))
+BULK_VERIFY_FLUSH_INTERVAL = float(os.getenv("BULK_VERIFY_FLUSH_INTERVAL", "1.0"))
+
+# Optional bearer token required by /metrics
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
 
 # ==================== Models ====================
 
-class PurchaseVerificationRequest(BaseModel):
+class BulkVerifyItem(BaseModel):
     product_id: str
     purchase_token: str
-    platform: str  # "android" or "ios"
-    device_id: Optional[str] = None
+    device_id: str
     email: Optional[str] = None
 
 
-class PurchaseVerificationResponse(BaseModel):
-    success: bool
-    is_valid: bool
-    subscription_tier: Optional[str] = None
-    expiry_date: Optional[str] = None
-    message: str
+class BulkVerifyRequest(BaseModel):
+    items: List[BulkVerifyItem] = Field(..., min_length=1, max_length=10000)
+    concurrency: int = Field(BULK_VERIFY_CONCURRENCY, ge=1, le=BULK_VERIFY_MAX_CONCURRENCY)
+
+
+class LicenseBatchCheckRequest(BaseModel):
+    device_ids: List[str] = Field(..., min_length=1, max_length=1000)
 
 
 # ==================== Google Play Verification ====================
 
-async def verify_google_play_purchase(product_id: str, purchase_token: str) -> dict:
-    """Verify purchase with Google Play Developer API"""
+play_verify_flights = SingleFlight("play_verify")
+
+# Cache hit ratios, pool and single-flight counters, read at scrape time
+stats_collector = StatsCollector({
+    "license_cache": license_cache.stats,
+    "verification_cache": verification_cache.stats,
+    "db_pool": pool_stats,
+    "play_http_pool": play_pool_stats,
+    "play_verify_flights": play_verify_flights.stats,
+    "router_verify_flights": iap.verify_flights.stats,
+    "google_token": play_token_manager.stats,
+    "rtdn": lambda: rtdn.stats,
+    "rate_limit": lambda: ratelimit_stats,
+    "play_breaker": play_breaker.stats,
+    "entitlements": lambda: entitlement_stats,
+})
+REGISTRY.register(stats_collector)
+
+
+async def verify_google_play_purchase(product_id: str, purchase_token: str, allow_stale: bool = True) -> dict:
+    """
+    Verify purchase with Google Play Developer API.
+    
+    allow_stale=False always asks Google (no cached answer, no last-known-
+    state fallback) and refreshes the cache from the reply, for callers that
+    exist to refresh stored state.
+    """
     
-    if not GOOGLE_SERVICE_ACCOUNT_JSON:
+    if not play_token_manager.configured:
         return {"valid": False, "error": "Google Play verification not configured"}
     
-    try:
-        credentials_info = json.loads(GOOGLE_SERVICE_ACCOUNT_JSON)
-        credentials = service_account.Credentials.from_service_account_info(
-            credentials_info,
-            scopes=['https://www.googleapis.com/auth/androidpublisher']
+    if allow_stale:
+        cached = await verification_cache.get((product_id, purchase_token))
+        if cached is not None:
+            return dict(cached)
+    
+    # Concurrent verifies of the same token share one Google round trip; if
+    # Google is down or slow, the license's last known state answers instead
+    def fetch():
+        return play_verify_flights.do(
+            (product_id, purchase_token),
+            _fetch_google_play_verification,
+            product_id,
+            purchase_token
         )
+    
+    if not allow_stale:
+        result = await fetch()
+        if result.get("definitive") and not (result.get("valid") and result.get("is_active")):
+            # Active answers were re-cached by the fetch; drop a now-wrong one
+            await invalidate_verification(purchase_token, product_id)
+        return dict(result)
+    result = await verify_with_fallback(product_id, purchase_token, fetch)
+    return dict(result)
+
+
+async def _fetch_google_play_verification(product_id: str, purchase_token: str) -> dict:
+    """Call subscriptions.get and cache an active result"""
+    try:
+        response = await get_subscription(product_id, purchase_token)
         
-        credentials.refresh(Request())
-        access_token = credentials.token
-        
-        url = f"https://androidpublisher.googleapis.com/androidpublisher/v3/applications/{GOOGLE_PLAY_PACKAGE_NAME}/purchases/subscriptions/{product_id}/tokens/{purchase_token}"
-        
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
-        }
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=headers)
+        if response.status_code == 200:
+            data = response.json()
+            expiry_time_millis = int(data.get('expiryTimeMillis', 0))
+            expiry_date = datetime.fromtimestamp(expiry_time_millis / 1000)
+            is_active = expiry_date > datetime.now()
             
-            if response.status_code == 200:
-                data = response.json()
-                expiry_time_millis = int(data.get('expiryTimeMillis', 0))
-                expiry_date = datetime.fromtimestamp(expiry_time_millis / 1000)
-                is_active = expiry_date > datetime.now()
-                
-                return {
-                    "valid": True,
-                    "is_active": is_active,
-                    "expiry_date": expiry_date.isoformat(),
-                    "auto_renewing": data.get('autoRenewing', False)
-                }
-            else:
-                return {"valid": False, "error": f"Google Play API error: {response.status_code}"}
+            result = {
+                "valid": True,
+                "is_active": is_active,
+                "expiry_date": expiry_date.isoformat(),
+                "auto_renewing": data.get('autoRenewing', False),
+                "definitive": True
+            }
+            await cache_verification(product_id, purchase_token, result, expiry_time_millis)
+            return result
+        else:
+            return {
+                "valid": False,
+                "error": f"Google Play API error: {response.status_code}",
+                "retryable": is_upstream_failure(response),
+                # Unknown / revoked purchase; anything else (401, 403, ...) says nothing about it
+                "definitive": response.status_code in (404, 410)
+            }
+    
+    except CircuitOpenError:
+        logger.warning("Google Play circuit open, verification skipped", extra={"fields": {"product_id": product_id}})
+        return {"valid": False, "error": "Google Play temporarily unavailable", "retryable": True}
                 
     except Exception as e:
-        print(f"Error verifying purchase: {e}")
-        return {"valid": False, "error": str(e)}
+        logger.exception("Error verifying purchase", extra={"fields": {"product_id": product_id}})
+        return {"valid": False, "error": str(e), "retryable": True}
 
 
 # ==================== Database Functions ====================
 
-def get_or_create_license(device_id: str, email: Optional[str] = None):
+async def get_or_create_license(device_id: str, email: Optional[str] = None):
     """Get existing license or create new free tier"""
-    conn = get_db()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    
-    try:
+    async with connection() as conn:
         # Try to find existing license
-        cur.execute(
-            "SELECT * FROM license WHERE device_id = %s",
+        cur = await execute(
+            conn,
+            "license_by_device",
+            "SELECT * FROM licenses WHERE device_id = %s",
             (device_id,)
         )
-        license_row = cur.fetchone()
+        license_row = await cur.fetchone()
         
         if license_row:
             return dict(license_row)
         
         # Create new free tier license
-        cur.execute(
+        cur = await execute(
+            conn,
+            "license_insert_free",
             """
-            INSERT INTO license (device_id, email, tier, is_active)
+            INSERT INTO licenses (device_id, email, tier, is_active)
             VALUES (%s, %s, 'free', true)
             RETURNING *
             """,
             (device_id, email)
         )
-        license_row = cur.fetchone()
-        conn.commit()
-        
-        return dict(license_row)
-        
-    finally:
-        cur.close()
-        conn.close()
+        license_row = await cur.fetchone()
+    
+    await license_cache.invalidate(device_id)
+    return dict(license_row)
+
+
+UPSERT_LICENSE_SQL = """
+    INSERT INTO licenses (device_id, email, tier, iap_store, iap_product_id, iap_purchase_token,
+                          expires_at, is_active, activated_at, last_verified)
+    VALUES (%s, %s, %s, 'google_play', %s, %s, %s, true, NOW(), NOW())
+    ON CONFLICT (device_id) 
+    DO UPDATE SET
+        tier = EXCLUDED.tier,
+        iap_store = EXCLUDED.iap_store,
+        iap_product_id = EXCLUDED.iap_product_id,
+        iap_purchase_token = EXCLUDED.iap_purchase_token,
+        expires_at = EXCLUDED.expires_at,
+        is_active = true,
+        last_verified = NOW(),
+        updated_at = NOW(),
+        email = COALESCE(EXCLUDED.email, licenses.email)
+"""
 
 
-def update_license_from_purchase(
-    device_id: str,
-    product_id: str,
-    purchase_token: str,
-    tier: str,
-    expiry_date: str,
-    email: Optional[str] = None
-):
-    """Update license with verified purchase"""
-    conn = get_db()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+async def update_licenses_from_purchases(rows: List[tuple]):
+    """
+    Upsert many verified purchases in a single transaction.
     
-    try:
-        cur.execute(
-            """
-            INSERT INTO license (device_id, email, tier, iap_purchase_token, expiry_date, is_active, last_verified)
-            VALUES (%s, %s, %s, %s, %s, true, NOW())
-            ON CONFLICT (device_id) 
-            DO UPDATE SET
-                tier = EXCLUDED.tier,
-                iap_purchase_token = EXCLUDED.iap_purchase_token,
-                expiry_date = EXCLUDED.expiry_date,
-                is_active = true,
-                last_verified = NOW(),
-                email = COALESCE(EXCLUDED.email, license.email)
-            RETURNING *
-            """,
-            (device_id, email, tier, purchase_token, expiry_date)
-        )
-        license_row = cur.fetchone()
-        conn.commit()
-        
-        return dict(license_row)
-        
-    finally:
-        cur.close()
-        conn.close()
+    rows: (device_id, email, tier, product_id, purchase_token, expiry_date) tuples
+    """
+    async with connection() as conn:
+        async with conn.cursor() as cur:
+            with DB_QUERY_DURATION.labels("license_upsert_batch").time():
+                await cur.executemany(UPSERT_LICENSE_SQL, rows)
+    
+    await license_cache.invalidate_many(row[0] for row in rows)
+
+
+def _is_expired(license_dict: dict) -> bool:
+    """True once the stored expiry date has passed"""
+    expiry = license_dict.get('expires_at')
+    if not expiry:
+        return False
+    if isinstance(expiry, str):
+        expiry = datetime.fromisoformat(expiry)
+    return expiry < datetime.now()
 
 
-def check_license(device_id: str) -> dict:
+def _license_status(license_row) -> dict:
+    """Build the license check response for a row (or NO_LICENSE)"""
+    if license_row is NO_LICENSE:
+        return {
+            "valid": False,
+            "tier": "free",
+            "message": "No license found"
+        }
+    
+    # Check if expired
+    if _is_expired(license_row):
+        return {
+            "valid": True,
+            "tier": "free",
+            "is_active": False,
+            "message": "Subscription expired"
+        }
+    
+    return {
+        "valid": True,
+        "tier": license_row.get('tier', 'free'),
+        "is_active": license_row.get('is_active', False),
+        "expiry_date": license_row.get('expires_at'),
+        "message": "License valid"
+    }
+
+
+async def check_license(device_id: str) -> dict:
     """Check license status"""
-    conn = get_db()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+    license_row = await license_cache.get(device_id)
     
-    try:
-        cur.execute(
-            "SELECT * FROM license WHERE device_id = %s",
-            (device_id,)
-        )
-        license_row = cur.fetchone()
+    if license_row is None:
+        async with connection() as conn:
+            cur = await execute(
+                conn,
+                "license_by_device",
+                "SELECT * FROM licenses WHERE device_id = %s",
+                (device_id,)
+            )
+            license_row = await cur.fetchone()
         
-        if not license_row:
-            return {
-                "valid": False,
-                "tier": "free",
-                "message": "No license found"
-            }
+        license_row = dict(license_row) if license_row else NO_LICENSE
+        await license_cache.set(device_id, license_row)
+    
+    # Expiry is evaluated on read; the sweeper persists the downgrade
+    return _license_status(license_row)
+
+
+async def check_licenses(device_ids: List[str]) -> Dict[str, dict]:
+    """Check many devices with one set-based query (cache hits are reused)"""
+    device_ids = list(dict.fromkeys(device_ids))
+    rows = await license_cache.get_many(device_ids)
+    misses = [device_id for device_id in device_ids if device_id not in rows]
+    
+    # Bulk lookups don't populate the cache so support tooling can't evict
+    # the hot entries that app polling relies on
+    if misses:
+        async with connection() as conn:
+            cur = await execute(
+                conn,
+                "license_by_devices",
+                "SELECT * FROM licenses WHERE device_id = ANY(%s)",
+                (misses,)
+            )
+            for license_row in await cur.fetchall():
+                rows[license_row['device_id']] = dict(license_row)
         
-        license_dict = dict(license_row)
+        for device_id in misses:
+            rows.setdefault(device_id, NO_LICENSE)
+    
+    return {device_id: _license_status(license_row) for device_id, license_row in rows.items()}
+
+
+# ==================== Bulk Re-verification ====================
+
+async def bulk_reverify(items: List[BulkVerifyItem], concurrency: int) -> AsyncIterator[dict]:
+    """
+    Verify many purchases against Google Play and upsert the active ones.
+    
+    At most `concurrency` Play calls run at once, and every item waits for
+    Google's own answer (never the stored state). Active purchases are
+    written in batches of BULK_VERIFY_BATCH_SIZE (one transaction each), or
+    every BULK_VERIFY_FLUSH_INTERVAL while a slow tail is still running, and
+    a result is yielded per item as soon as it is final.
+    """
+    results: asyncio.Queue = asyncio.Queue()
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def verify_one(index: int, item: BulkVerifyItem):
+        try:
+            async with semaphore:
+                verification = await verify_google_play_purchase(
+                    item.product_id, item.purchase_token, allow_stale=False
+                )
+        except Exception as e:
+            verification = {"valid": False, "error": str(e)}
+        await results.put((index, item, verification))
+    
+    tasks = [asyncio.create_task(verify_one(i, item)) for i, item in enumerate(items)]
+    pending = []
+    last_flush = time.monotonic()
+    
+    async def flush():
+        rows = [
+            (item.device_id, item.email, TIER_MAP.get(item.product_id, "free"),
+             item.product_id, item.purchase_token, verification.get("expiry_date"))
+            for _, item, verification in pending
+        ]
+        try:
+            await update_licenses_from_purchases(rows)
+            error = None
+        except Exception as e:
+            logger.exception("Bulk license upsert failed", extra={"fields": {"rows": len(rows)}})
+            error = str(e)
         
-        # Check if expired
-        if license_dict.get('expiry_date'):
-            expiry = license_dict['expiry_date']
-            if isinstance(expiry, str):
-                expiry = datetime.fromisoformat(expiry)
+        flushed = [
+            {
+                "index": index,
+                "device_id": item.device_id,
+                "product_id": item.product_id,
+                "is_valid": True,
+                "expiry_date": verification.get("expiry_date"),
+                "stored": error is None,
+                **({"error": error} if error else {})
+            }
+            for index, item, verification in pending
+        ]
+        pending.clear()
+        return flushed
+    
+    try:
+        for _ in range(len(tasks)):
+            while True:
+                # Wake up for the flush interval even if no result arrives
+                timeout = None
+                if pending:
+                    timeout = max(0, last_flush + BULK_VERIFY_FLUSH_INTERVAL - time.monotonic())
+                try:
+                    index, item, verification = await asyncio.wait_for(results.get(), timeout)
+                    break
+                except asyncio.TimeoutError:
+                    for result in await flush():
+                        yield result
+                    last_flush = time.monotonic()
             
-            if expiry < datetime.now():
-                # Mark as expired
-                cur.execute(
-                    "UPDATE license SET is_active = false, tier = 'free' WHERE device_id = %s",
-                    (device_id,)
-                )
-                conn.commit()
-                return {
-                    "valid": True,
-                    "tier": "free",
-                    "is_active": False,
-                    "message": "Subscription expired"
+            if verification.get("valid") and verification.get("is_active"):
+                pending.append((index, item, verification))
+            else:
+                yield {
+                    "index": index,
+                    "device_id": item.device_id,
+                    "product_id": item.product_id,
+                    "is_valid": False,
+                    "stored": False,
+                    "error": verification.get("error", "Subscription expired or inactive")
                 }
+            
+            if pending and (
+                len(pending) >= BULK_VERIFY_BATCH_SIZE
+                or time.monotonic() - last_flush >= BULK_VERIFY_FLUSH_INTERVAL
+            ):
+                for result in await flush():
+                    yield result
+                last_flush = time.monotonic()
         
-        return {
-            "valid": True,
-            "tier": license_dict.get('tier', 'free'),
-            "is_active": license_dict.get('is_active', False),
-            "expiry_date": license_dict.get('expiry_date'),
-            "message": "License valid"
-        }
-        
+        if pending:
+            for result in await flush():
+                yield result
+    
     finally:
-        cur.close()
-        conn.close()
+        # Client went away - stop issuing Play calls
+        for task in tasks:
+            task.cancel()
 
 
 # ==================== API Endpoints ====================
 
+ROOT_RESPONSE = orjson.dumps({
+    "service": "ProStack API",
+    "status": "online",
+    "database": "connected" if DATABASE_URL else "not configured"
+})
+
+HEALTH_RESPONSE = orjson.dumps({"status": "healthy"})
+
+
 @app.get("/")
 async def root():
-    return {
-        "service": "ProStack API",
-        "status": "online",
-        "database": "connected" if DATABASE_URL else "not configured"
-    }
+    return Response(ROOT_RESPONSE, media_type="application/json")
 
 @app.get("/health")
-def health_check():
-    return {"status": "healthy"}
+async def health_check():
+    return Response(HEALTH_RESPONSE, media_type="application/json")
 
-@app.post("/api/v1/subscriptions/verify")
-async def verify_purchase(
-    request: PurchaseVerificationRequest,
+@app.post("/api/v1/subscriptions/verify-batch")
+async def verify_purchases_bulk(
+    request: BulkVerifyRequest,
     api_key: str = Header(..., alias="X-API-Key")
 ):
-    """Verify purchase and update license in database"""
+    """Re-verify many purchases (migrations); streams one NDJSON line per item"""
     
     if api_key != PROSTACK_API_KEY:
         raise HTTPException(status_code=401, detail="Invalid API key")
     
-    # Determine tier from product_id
-    tier_map = {
-        "prostack_premium": "premium",
-        "prostack_premium_yearly": "premium",
-        "prostack_business": "business",
-        "prostack_business_yearly": "business"
-    }
+    async def ndjson():
+        async for result in bulk_reverify(request.items, request.concurrency):
+            yield orjson.dumps(result) + b"\n"
     
-    tier = tier_map.get(request.product_id, "free")
-    
-    # Verify with Google Play
-    if request.platform == "android":
-        verification = await verify_google_play_purchase(
-            request.product_id,
-            request.purchase_token
-        )
-        
-        if not verification.get("valid"):
-            return PurchaseVerificationResponse(
-                success=True,
-                is_valid=False,
-                message=verification.get("error", "Purchase verification failed")
-            )
-        
-        if not verification.get("is_active"):
-            return PurchaseVerificationResponse(
-                success=True,
-                is_valid=False,
-                message="Subscription expired or inactive"
-            )
-        
-        # Update database with verified purchase
-        if request.device_id:
-            update_license_from_purchase(
-                device_id=request.device_id,
-                product_id=request.product_id,
-                purchase_token=request.purchase_token,
-                tier=tier,
-                expiry_date=verification.get("expiry_date"),
-                email=request.email
-            )
-        
-        return PurchaseVerificationResponse(
-            success=True,
-            is_valid=True,
-            subscription_tier=tier,
-            expiry_date=verification.get("expiry_date"),
-            message="Purchase verified and license updated"
-        )
-    
-    else:
-        return PurchaseVerificationResponse(
-            success=False,
-            is_valid=False,
-            message="iOS verification not yet implemented"
-        )
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
 
 
 @app.get("/api/v1/license/check")
@@ -339,11 +528,115 @@ async def check_license_status(
     if api_key != PROSTACK_API_KEY:
         raise HTTPException(status_code=401, detail="Invalid API key")
     
-    license_info = check_license(device_id)
+    license_info = await check_license(device_id)
     
-    return {
+    # Hot path: orjson encodes the row's datetimes itself, skip jsonable_encoder
+    return ORJSONResponse({
         "success": True,
         **license_info
+    })
+
+
+@app.post("/api/v1/license/check-batch")
+async def check_license_batch(
+    request: LicenseBatchCheckRequest,
+    api_key: str = Header(..., alias="X-API-Key")
+):
+    """Check license status for many devices at once (support tooling, family sharing)"""
+    
+    if api_key != PROSTACK_API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+    
+    licenses = await check_licenses(request.device_ids)
+    
+    return ORJSONResponse({
+        "success": True,
+        "licenses": licenses
+    })
+
+
+@app.post("/api/v1/rtdn/push", status_code=204)
+async def rtdn_push(
+    request: FastAPIRequest,
+    token: Optional[str] = None,
+    authorization: Optional[str] = Header(None)
+):
+    """
+    Pub/Sub push endpoint for Google Play Real-time Developer Notifications.
+    
+    A 2xx answer acknowledges the message; errors make Pub/Sub redeliver it,
+    which is safe because applying a notification twice is a no-op. Refused
+    unless RTDN_PUSH_TOKEN or RTDN_PUSH_AUDIENCE is configured.
+    """
+    
+    if not rtdn.push_auth_configured():
+        raise HTTPException(status_code=503, detail="RTDN push authentication not configured")
+    
+    if not await rtdn.authorize_push(token, authorization):
+        raise HTTPException(status_code=401, detail="Invalid push credentials")
+    
+    try:
+        envelope = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    
+    try:
+        await rtdn.handle_push(envelope)
+    except rtdn.InvalidNotification as e:
+        # Redelivery would not help - acknowledge and move on
+        logger.warning("Ignoring RTDN push", extra={"fields": {"error": str(e)}})
+    
+    return Response(status_code=204)
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics(authorization: Optional[str] = Header(None)):
+    """Prometheus scrape endpoint"""
+    
+    if METRICS_TOKEN and authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    
+    return Response(generate_latest(scrape_registry([stats_collector])), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/api/v1/admin/stats")
+async def admin_stats(api_key: str = Header(..., alias="X-API-Key")):
+    """Runtime counters for capacity tuning"""
+    
+    if api_key != PROSTACK_API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+    
+    return {
+        "success": True,
+        "db_pool": pool_stats(),
+        "license_cache": license_cache.stats(),
+        "verification_cache": verification_cache.stats(),
+        "google_token": play_token_manager.stats(),
+        "play_http_pool": play_pool_stats(),
+        "single_flight": [play_verify_flights.stats(), iap.verify_flights.stats()],
+        "ack_queue": ack_stats,
+        "expiry_sweeper": sweeper_stats,
+        "rtdn": rtdn.stats,
+        "rate_limit": ratelimit_stats,
+        "play_breaker": play_breaker.stats(),
+        "entitlements": entitlement_stats
+    }
+
+
+@app.delete("/api/v1/admin/verification-cache")
+async def invalidate_verification_cache(
+    purchase_token: str,
+    product_id: Optional[str] = None,
+    api_key: str = Header(..., alias="X-API-Key")
+):
+    """Drop cached Google Play answers for a purchase token"""
+    
+    if api_key != PROSTACK_API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+    
+    return {
+        "success": True,
+        "invalidated": await invalidate_verification(purchase_token, product_id)
     }
 
 
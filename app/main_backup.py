@@ -6,24 +6,47 @@ NO DATA STORAGE - Stateless API
 
 from fastapi import FastAPI, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, Response
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
-import openai
-import boto3
-from botocore.client import Config
+import asyncio
 import os
+import random
 from datetime import datetime
 import json
 import httpx
-from google.oauth2 import service_account
-from google.auth.transport.requests import Request
+import orjson
+
+from contextlib import asynccontextmanager
+from functools import lru_cache
+
+from .cache import verification_cache, cache_verification
+from . import pool
+from .entitlements import stored_entitlement
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Only for reading RTDN-maintained entitlements; no-op without DATABASE_URL
+    await pool.open_pool()
+    # Import openai / boto3 in the background while the server starts taking
+    # requests, instead of before it can bind (most of the cold start)
+    warm_up = asyncio.create_task(asyncio.to_thread(_warm_up))
+    yield
+    warm_up.cancel()
+    if get_openai.cache_info().currsize:
+        await get_openai().close()
+    await pool.close_pool()
 
 
 # Initialize FastAPI
 app = FastAPI(
     title="ProStack AI Resume API",
     description="Privacy-first AI Resume Builder - We don't store any data",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    # orjson instead of the stdlib encoder for every response
+    default_response_class=ORJSONResponse
 )
 
 # CORS Configuration
@@ -36,10 +59,23 @@ app.add_middleware(
 )
 
 # OpenAI Configuration
-openai.api_key = os.getenv("OPENAI_API_KEY")
-if not openai.api_key:
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+if not OPENAI_API_KEY:
     raise ValueError("OPENAI_API_KEY environment variable not set")
 
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4")
+# Per attempt; each call site may pass a tighter one
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "30"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+OPENAI_RETRY_BASE_DELAY = float(os.getenv("OPENAI_RETRY_BASE_DELAY", "0.5"))
+OPENAI_RETRY_MAX_DELAY = float(os.getenv("OPENAI_RETRY_MAX_DELAY", "4"))
+# Completions in flight at once in this process (all requests together)
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+# Enhance every job's achievements in one completion instead of one per job
+OPENAI_BATCH_ACHIEVEMENTS = os.getenv("OPENAI_BATCH_ACHIEVEMENTS", "true").lower() != "false"
+# Reply budget of one batched call; larger resumes are split across calls
+ACHIEVEMENTS_BATCH_MAX_TOKENS = int(os.getenv("ACHIEVEMENTS_BATCH_MAX_TOKENS", "3000"))
+
 # API Key for your mobile app (simple auth)
 PROSTACK_API_KEY = os.getenv("PROSTACK_API_KEY", "your-secure-api-key-here")
 
@@ -53,14 +89,94 @@ B2_APPLICATION_KEY = os.getenv("B2_APPLICATION_KEY")  # Application Key
 B2_BUCKET_NAME = os.getenv("B2_BUCKET_NAME")  # Your bucket name
 B2_ENDPOINT = os.getenv("B2_ENDPOINT")  # e.g., s3.us-west-004.backblazeb2.com
 
-# Initialize S3 client for Backblaze B2
-s3_client = boto3.client(
-    's3',
-    endpoint_url=f'https://{B2_ENDPOINT}',
-    aws_access_key_id=B2_KEY_ID,
-    aws_secret_access_key=B2_APPLICATION_KEY,
-    config=Config(signature_version='s3v4')
-)
+
+@lru_cache(maxsize=None)
+def get_openai():
+    """Shared AsyncOpenAI client (keep-alive connection pool), built on first use"""
+    from openai import AsyncOpenAI
+    
+    return AsyncOpenAI(
+        api_key=OPENAI_API_KEY,
+        timeout=OPENAI_TIMEOUT,
+        # Retries are done in chat_completion, with jitter and under the concurrency cap
+        max_retries=0,
+        http_client=httpx.AsyncClient(
+            timeout=OPENAI_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONCURRENCY,
+                max_keepalive_connections=OPENAI_MAX_CONCURRENCY
+            )
+        )
+    )
+
+
+_openai_slots = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+
+
+def _retry_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff, so retries of a burst don't line up"""
+    return random.uniform(0, min(OPENAI_RETRY_MAX_DELAY, OPENAI_RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def _is_retryable(error: Exception) -> bool:
+    import openai
+    
+    return isinstance(error, (
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.RateLimitError,
+        openai.InternalServerError,
+    ))
+
+
+async def chat_completion(messages: List[Dict[str, str]], temperature: float, max_tokens: int,
+                          timeout: float = OPENAI_TIMEOUT):
+    """
+    Chat completion on the shared client.
+    
+    Waits for one of OPENAI_MAX_CONCURRENCY slots; timeouts, connection
+    errors, 429 and 5xx are retried up to OPENAI_MAX_RETRIES times with
+    jittered backoff (outside the slot, so waiting retries don't hold it).
+    """
+    attempt = 0
+    while True:
+        try:
+            async with _openai_slots:
+                return await get_openai().chat.completions.create(
+                    model=OPENAI_MODEL,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    timeout=timeout
+                )
+        except Exception as e:
+            if attempt >= OPENAI_MAX_RETRIES or not _is_retryable(e):
+                raise
+            await asyncio.sleep(_retry_delay(attempt))
+            attempt += 1
+
+
+@lru_cache(maxsize=None)
+def get_s3_client():
+    """S3 client for Backblaze B2, built on first use"""
+    import boto3
+    from botocore.client import Config
+    
+    return boto3.client(
+        's3',
+        endpoint_url=f'https://{B2_ENDPOINT}',
+        aws_access_key_id=B2_KEY_ID,
+        aws_secret_access_key=B2_APPLICATION_KEY,
+        config=Config(signature_version='s3v4')
+    )
+
+
+def _warm_up():
+    try:
+        get_openai()
+        get_s3_client()
+    except Exception as e:
+        print(f"Warm-up failed, clients will be built on first use: {e}")
 
 # ==================== Models ====================
 
@@ -200,6 +316,20 @@ SUBSCRIPTION_PRODUCTS = {
     ),
 }
 
+# Constant payloads, encoded once instead of on every request
+PRODUCTS_RESPONSE = orjson.dumps({
+    "success": True,
+    "products": [product.model_dump() for product in SUBSCRIPTION_PRODUCTS.values()]
+})
+
+ROOT_RESPONSE = orjson.dumps({
+    "service": "ProStack AI Resume API",
+    "status": "online",
+    "privacy": "We don't store any data - all processing is stateless",
+    "version": "1.0.0"
+})
+
+
 class BackupRequest(BaseModel):
     user_id: str  # Unique identifier for user
     backup_name: str = "prostack_backup"
@@ -228,7 +358,26 @@ async def verify_google_play_purchase(product_id: str, purchase_token: str) -> D
             "error": "Google Play verification not configured"
         }
     
+    # One upstream answer serves every entitlement check until it could change
+    cached = await verification_cache.get((product_id, purchase_token))
+    if cached is not None:
+        return dict(cached)
+    
+    # Active licenses kept current by Play notifications answer without a
+    # Google call; inactive ones are confirmed there in case a renewal
+    # notification was lost
+    if pool.pool is not None:
+        try:
+            stored = await stored_entitlement(product_id, purchase_token, notified_only=True)
+            if stored is not None and stored["is_active"]:
+                return stored
+        except Exception as e:
+            print(f"Stored entitlement lookup failed, asking Google: {e}")
+    
     try:
+        from google.oauth2 import service_account
+        from google.auth.transport.requests import Request
+        
         # Load service account credentials
         credentials_info = json.loads(GOOGLE_SERVICE_ACCOUNT_JSON)
         credentials = service_account.Credentials.from_service_account_info(
@@ -259,13 +408,15 @@ async def verify_google_play_purchase(product_id: str, purchase_token: str) -> D
                 expiry_date = datetime.fromtimestamp(expiry_time_millis / 1000)
                 is_active = expiry_date > datetime.now()
                 
-                return {
+                result = {
                     "valid": True,
                     "is_active": is_active,
                     "expiry_date": expiry_date.isoformat(),
                     "auto_renewing": data.get('autoRenewing', False),
                     "payment_state": data.get('paymentState', 0)
                 }
+                await cache_verification(product_id, purchase_token, result, expiry_time_millis)
+                return dict(result)
             else:
                 return {
                     "valid": False,
@@ -289,10 +440,7 @@ async def get_subscription_products(api_key: str = Header(..., alias="X-API-Key"
     if api_key != PROSTACK_API_KEY:
         raise HTTPException(status_code=401, detail="Invalid API key")
     
-    return {
-        "success": True,
-        "products": [product.dict() for product in SUBSCRIPTION_PRODUCTS.values()]
-    }
+    return Response(PRODUCTS_RESPONSE, media_type="application/json")
 
 
 @app.post("/api/v1/subscriptions/verify", response_model=PurchaseVerificationResponse)
@@ -434,7 +582,7 @@ def verify_api_key(x_api_key: str = Header(...)):
 
 # ==================== AI Resume Generation ====================
 
-def generate_professional_summary(request: ResumeRequest) -> str:
+async def generate_professional_summary(request: ResumeRequest) -> str:
     """Generate AI-enhanced professional summary"""
     
     if not request.enhance_summary and request.summary:
@@ -470,8 +618,7 @@ def generate_professional_summary(request: ResumeRequest) -> str:
     """
     
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
+        response = await chat_completion(
             messages=[
                 {
                     "role": "system",
@@ -483,7 +630,8 @@ def generate_professional_summary(request: ResumeRequest) -> str:
                 }
             ],
             temperature=0.7,
-            max_tokens=200
+            max_tokens=200,
+            timeout=20
         )
         
         return response.choices[0].message.content.strip()
@@ -493,7 +641,7 @@ def generate_professional_summary(request: ResumeRequest) -> str:
         return request.summary or "Experienced professional seeking new opportunities."
 
 
-def enhance_achievements(achievements: List[str], role: str) -> List[str]:
+async def enhance_achievements(achievements: List[str], role: str) -> List[str]:
     """Enhance achievement bullets with AI"""
     
     if not achievements:
@@ -514,8 +662,7 @@ def enhance_achievements(achievements: List[str], role: str) -> List[str]:
     """
     
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
+        response = await chat_completion(
             messages=[
                 {
                     "role": "system",
@@ -527,7 +674,8 @@ def enhance_achievements(achievements: List[str], role: str) -> List[str]:
                 }
             ],
             temperature=0.7,
-            max_tokens=500
+            max_tokens=500,
+            timeout=30
         )
         
         improved = json.loads(response.choices[0].message.content.strip())
@@ -538,7 +686,127 @@ def enhance_achievements(achievements: List[str], role: str) -> List[str]:
         return achievements
 
 
-def extract_keywords(request: ResumeRequest) -> List[str]:
+def _estimated_reply_tokens(exp: WorkExperience) -> int:
+    """Rough reply size for one job: ~4 characters per token, rewritten bullets run longer"""
+    return 50 + sum(len(a) for a in exp.achievements) // 2
+
+
+def _batch_groups(experiences: List[WorkExperience]) -> List[List[int]]:
+    """Positions of the jobs, grouped so each group's reply fits ACHIEVEMENTS_BATCH_MAX_TOKENS"""
+    groups, current, budget = [], [], 0
+    for i, exp in enumerate(experiences):
+        needed = _estimated_reply_tokens(exp)
+        if current and budget + needed > ACHIEVEMENTS_BATCH_MAX_TOKENS:
+            groups.append(current)
+            current, budget = [], 0
+        current.append(i)
+        budget += needed
+    if current:
+        groups.append(current)
+    return groups
+
+
+async def _enhance_achievements_group(experiences: List[WorkExperience]) -> List[List[str]]:
+    """One batched call; falls back to one call per job if the reply is cut off"""
+    originals = [list(exp.achievements) for exp in experiences]
+    jobs = {
+        str(i): {"role": exp.title, "achievements": exp.achievements}
+        for i, exp in enumerate(experiences)
+    }
+    
+    context = f"""
+    Improve the achievement bullets of each job below for its role.
+    Make them more impactful by:
+    1. Using strong action verbs
+    2. Adding metrics where possible (estimate if needed)
+    3. Highlighting business impact
+    4. Keeping them concise (1-2 lines each)
+    
+    Jobs, keyed by id:
+    {json.dumps(jobs, indent=2)}
+    
+    Return a JSON object with the same ids as keys and each job's improved
+    bullets as a JSON array of strings. Return ONLY the JSON object.
+    """
+    
+    try:
+        response = await chat_completion(
+            messages=[
+                {
+                    "role": "system",
+                    "content": "You are an expert resume writer who transforms ordinary achievements into compelling, metrics-driven accomplishments."
+                },
+                {
+                    "role": "user",
+                    "content": context
+                }
+            ],
+            temperature=0.7,
+            max_tokens=ACHIEVEMENTS_BATCH_MAX_TOKENS,
+            timeout=45
+        )
+        
+        choice = response.choices[0]
+        if choice.finish_reason == "length" and len(experiences) > 1:
+            # Truncated JSON can't be parsed; don't lose every job to it
+            print(f"Batched achievements reply truncated for {len(experiences)} jobs, retrying per job")
+            return list(await asyncio.gather(*(
+                enhance_achievements(exp.achievements, exp.title) for exp in experiences
+            )))
+        
+        content = choice.message.content.strip()
+        if content.startswith("```"):
+            content = content.strip("`").removeprefix("json").strip()
+        improved = json.loads(content)
+    
+    except Exception as e:
+        print(f"Error enhancing achievements (batched): {e}")
+        return originals
+    
+    if not isinstance(improved, dict):
+        return originals
+    
+    results = []
+    for key, original in zip(jobs, originals):
+        bullets = improved.get(key)
+        if isinstance(bullets, list) and bullets and all(isinstance(b, str) for b in bullets):
+            results.append(bullets)
+        else:
+            results.append(original)
+    return results
+
+
+async def enhance_achievements_batch(experiences: List[WorkExperience]) -> List[List[str]]:
+    """
+    Enhance the achievements of several jobs in as few GPT calls as fit.
+    
+    Jobs are grouped so each group's reply fits ACHIEVEMENTS_BATCH_MAX_TOKENS
+    (usually one group per resume) and the groups run concurrently. Within a
+    group, jobs are sent keyed by position and read back by key; a job whose
+    entry is missing or malformed keeps its original bullets, and so do all
+    of the group's if the call fails.
+    """
+    results: List[List[str]] = [[] for _ in experiences]
+    groups = _batch_groups(experiences)
+    improved = await asyncio.gather(*(
+        _enhance_achievements_group([experiences[i] for i in group]) for group in groups
+    ))
+    for group, bullets in zip(groups, improved):
+        for i, achievements in zip(group, bullets):
+            results[i] = achievements
+    return results
+
+
+async def enhance_all_achievements(experiences: List[WorkExperience]) -> List[List[str]]:
+    """Improved achievements per job: one batched call, or one call per job"""
+    if OPENAI_BATCH_ACHIEVEMENTS and len(experiences) > 1:
+        return await enhance_achievements_batch(experiences)
+    return list(await asyncio.gather(*(
+        enhance_achievements(exp.achievements, exp.title) for exp in experiences
+    )))
+
+
+async def extract_keywords(request: ResumeRequest) -> List[str]:
     """Extract relevant keywords for ATS optimization"""
     
     keywords = set()
@@ -549,8 +817,7 @@ def extract_keywords(request: ResumeRequest) -> List[str]:
     # From job description (if provided)
     if request.job_description:
         try:
-            response = openai.ChatCompletion.create(
-                model="gpt-4",
+            response = await chat_completion(
                 messages=[
                     {
                         "role": "system",
@@ -562,7 +829,8 @@ def extract_keywords(request: ResumeRequest) -> List[str]:
                     }
                 ],
                 temperature=0.3,
-                max_tokens=200
+                max_tokens=200,
+                timeout=20
             )
             
             jd_keywords = json.loads(response.choices[0].message.content.strip())
@@ -579,6 +847,10 @@ def extract_keywords(request: ResumeRequest) -> List[str]:
     return sorted(list(keywords))
 
 
+async def _no_keywords() -> List[str]:
+    return []
+
+
 def calculate_ats_score(request: ResumeRequest, keywords: List[str]) -> int:
     """Calculate ATS compatibility score (0-100)"""
     
@@ -647,12 +919,7 @@ def generate_suggestions(request: ResumeRequest) -> List[str]:
 @app.get("/")
 async def root():
     """Health check endpoint"""
-    return {
-        "service": "ProStack AI Resume API",
-        "status": "online",
-        "privacy": "We don't store any data - all processing is stateless",
-        "version": "1.0.0"
-    }
+    return Response(ROOT_RESPONSE, media_type="application/json")
 
 
 @app.get("/health")
@@ -661,7 +928,7 @@ async def health_check():
     return {
         "status": "healthy",
         "timestamp": datetime.utcnow().isoformat(),
-        "openai_configured": bool(openai.api_key),
+        "openai_configured": bool(OPENAI_API_KEY),
         "data_storage": "none - stateless API"
     }
 
@@ -683,19 +950,22 @@ async def generate_resume(
         raise HTTPException(status_code=401, detail="Invalid API key")
     
     try:
-        # Generate AI-enhanced summary
-        summary = generate_professional_summary(request)
-        
-        # Enhance work experience achievements
-        enhanced_experience = []
-        for exp in request.work_experience:
-            if request.improve_achievements and exp.achievements:
-                improved = enhance_achievements(exp.achievements, exp.title)
-                exp.achievements = improved
-            enhanced_experience.append(exp.dict())
+        # Summary, achievements and keywords are independent GPT calls; run
+        # them together (bounded by OPENAI_MAX_CONCURRENCY) so the request
+        # takes about as long as the slowest one
+        to_enhance = [
+            exp for exp in request.work_experience
+            if request.improve_achievements and exp.achievements
+        ]
+        summary, keywords, improved = await asyncio.gather(
+            generate_professional_summary(request),
+            extract_keywords(request) if request.optimize_keywords else _no_keywords(),
+            enhance_all_achievements(to_enhance)
+        )
         
-        # Extract keywords for ATS
-        keywords = extract_keywords(request) if request.optimize_keywords else []
+        for exp, achievements in zip(to_enhance, improved):
+            exp.achievements = achievements
+        enhanced_experience = [exp.dict() for exp in request.work_experience]
         
         # Calculate ATS score
         ats_score = calculate_ats_score(request, keywords)
@@ -723,13 +993,14 @@ async def generate_resume(
             "generated_at": datetime.utcnow().isoformat()
         }
         
-        return ResumeResponse(
+        # Already validated - skip FastAPI's second validation and jsonable_encoder pass
+        return ORJSONResponse(ResumeResponse(
             success=True,
             resume_data=resume_data,
             suggestions=suggestions,
             ats_score=ats_score,
             keywords=keywords[:20]  # Top 20 keywords
-        )
+        ).model_dump())
     
     except Exception as e:
         print(f"Error generating resume: {e}")
@@ -748,8 +1019,7 @@ async def enhance_summary_only(
         raise HTTPException(status_code=401, detail="Invalid API key")
     
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
+        response = await chat_completion(
             messages=[
                 {
                     "role": "system",
@@ -761,7 +1031,8 @@ async def enhance_summary_only(
                 }
             ],
             temperature=0.7,
-            max_tokens=200
+            max_tokens=200,
+            timeout=20
         )
         
         return {
@@ -784,8 +1055,7 @@ async def analyze_job_description(
         raise HTTPException(status_code=401, detail="Invalid API key")
     
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
+        response = await chat_completion(
             messages=[
                 {
                     "role": "system",
@@ -797,7 +1067,8 @@ async def analyze_job_description(
                 }
             ],
             temperature=0.3,
-            max_tokens=500
+            max_tokens=500,
+            timeout=30
         )
         
         analysis = json.loads(response.choices[0].message.content.strip())
@@ -841,7 +1112,7 @@ async def get_backup_upload_url(
         backup_key = f"backups/{request.user_id}/{request.backup_name}.db"
         
         # Generate presigned upload URL (valid for 1 hour)
-        upload_url = s3_client.generate_presigned_url(
+        upload_url = get_s3_client().generate_presigned_url(
             'put_object',
             Params={
                 'Bucket': B2_BUCKET_NAME,
@@ -894,12 +1165,12 @@ async def get_backup_download_url(
         
         # Check if backup exists
         try:
-            s3_client.head_object(Bucket=B2_BUCKET_NAME, Key=backup_key)
+            get_s3_client().head_object(Bucket=B2_BUCKET_NAME, Key=backup_key)
         except:
             raise HTTPException(status_code=404, detail="Backup not found")
         
         # Generate presigned download URL (valid for 1 hour)
-        download_url = s3_client.generate_presigned_url(
+        download_url = get_s3_client().generate_presigned_url(
             'get_object',
             Params={
                 'Bucket': B2_BUCKET_NAME,
@@ -945,7 +1216,7 @@ async def list_backups(
     
     try:
         # List objects in user's backup folder
-        response = s3_client.list_objects_v2(
+        response = get_s3_client().list_objects_v2(
             Bucket=B2_BUCKET_NAME,
             Prefix=f"backups/{user_id}/"
         )
@@ -993,7 +1264,7 @@ async def delete_backup(
     try:
         backup_key = f"backups/{request.user_id}/{request.backup_name}.db"
         
-        s3_client.delete_object(
+        get_s3_client().delete_object(
             Bucket=B2_BUCKET_NAME,
             Key=backup_key
         )
@@ -0,0 +1,130 @@
+"""
+Prometheus instrumentation (served at /metrics)
+"""
+
+import os
+import time
+from typing import Callable, Dict, Iterable
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Latency buckets tuned for API work: 5 ms .. 10 s
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "prostack_http_request_duration_seconds",
+    "Time spent handling HTTP requests",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+
+PLAY_API_DURATION = Histogram(
+    "prostack_play_api_duration_seconds",
+    "Google Play Developer API round trip time",
+    ["operation"],
+    buckets=LATENCY_BUCKETS,
+)
+
+PLAY_API_RESPONSES = Counter(
+    "prostack_play_api_responses_total",
+    "Google Play Developer API responses by status code",
+    ["operation", "code"],
+)
+
+DB_QUERY_DURATION = Histogram(
+    "prostack_db_query_duration_seconds",
+    "Database query time",
+    ["query"],
+    buckets=LATENCY_BUCKETS,
+)
+
+DB_POOL_WAIT = Histogram(
+    "prostack_db_pool_wait_seconds",
+    "Time spent waiting for a pooled database connection",
+    ["pool"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+
+
+class MetricsMiddleware:
+    """Per-route latency histogram (labelled by route template, not raw path)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.labels(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status),
+            ).observe(time.perf_counter() - start)
+
+
+class StatsCollector:
+    """
+    Exposes the counters the caches, pools and single-flight groups already
+    keep, read at scrape time so the request path pays nothing extra.
+    """
+
+    def __init__(self, sources: Dict[str, Callable[[], dict]]):
+        self.sources = sources
+
+    def collect(self):
+        hits = CounterMetricFamily("prostack_cache_hits", "Cache hits", labels=["cache"])
+        misses = CounterMetricFamily("prostack_cache_misses", "Cache misses", labels=["cache"])
+        evictions = CounterMetricFamily("prostack_cache_evictions", "Cache LRU evictions", labels=["cache"])
+        ratio = GaugeMetricFamily("prostack_cache_hit_ratio", "Cache hit ratio", labels=["cache"])
+        size = GaugeMetricFamily("prostack_cache_entries", "Cache entries", labels=["cache"])
+        gauges = GaugeMetricFamily("prostack_component_stat", "Numeric runtime stats", labels=["component", "stat"])
+
+        for component, source in self.sources.items():
+            stats = source()
+            if "hits" in stats and "misses" in stats:
+                hits.add_metric([component], stats["hits"])
+                misses.add_metric([component], stats["misses"])
+                evictions.add_metric([component], stats.get("evictions", 0))
+                ratio.add_metric([component], stats["hit_ratio"] or 0)
+                size.add_metric([component], stats["size"])
+                continue
+            for key, value in stats.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    gauges.add_metric([component, key], value)
+
+        yield from (hits, misses, evictions, ratio, size, gauges)
+
+
+def scrape_registry(local_collectors: Iterable) -> CollectorRegistry:
+    """
+    Registry to render at /metrics.
+
+    Under gunicorn (PROMETHEUS_MULTIPROC_DIR set) counters and histograms
+    are aggregated across workers from their shared files; the local
+    collectors then report the worker that served the scrape.
+    """
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+
+    from prometheus_client import multiprocess
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    for collector in local_collectors:
+        registry.register(collector)
+    return registry
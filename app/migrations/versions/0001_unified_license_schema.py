@@ -0,0 +1,152 @@
+"""Unified license schema with indexes for hot lookups
+
+Brings every existing deployment to one `licenses` table:
+
+- fresh databases get the table created from scratch
+- databases bootstrapped by SQLModel create_all() get the missing column,
+  server defaults and indexes added; where several rows share a device_id,
+  the newest keeps it and the older ones are detached (device_id set to
+  NULL, purchase data kept) so the unique index can be built
+- rows from the legacy `license` table (written by app/main.py, keyed by
+  device_id with an expiry_date column) are copied over and the old table
+  is renamed to `license_legacy`
+
+Not reversible: downgrade() refuses to run (restore from a backup instead).
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+LICENSE_KEY_DEFAULT = sa.text("'lic_' || replace(gen_random_uuid()::text, '-', '')")
+
+
+def _create_licenses():
+    op.create_table(
+        "licenses",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("license_key", sa.String(), nullable=False, server_default=LICENSE_KEY_DEFAULT),
+        sa.Column("tier", sa.String(), nullable=False, server_default="free"),
+        sa.Column("device_id", sa.String(), nullable=True),
+        sa.Column("email", sa.String(), nullable=True),
+        sa.Column("is_active", sa.Boolean(), nullable=False, server_default=sa.text("true")),
+        sa.Column("iap_purchase_token", sa.String(), nullable=True),
+        sa.Column("iap_store", sa.String(), nullable=True),
+        sa.Column("iap_product_id", sa.String(), nullable=True),
+        sa.Column("activated_at", sa.DateTime(), nullable=True),
+        sa.Column("expires_at", sa.DateTime(), nullable=True),
+        sa.Column("last_verified", sa.DateTime(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False, server_default=sa.text("now()")),
+        sa.Column("updated_at", sa.DateTime(), nullable=False, server_default=sa.text("now()")),
+    )
+
+
+def _upgrade_create_all_licenses(inspector):
+    """Align a `licenses` table created by SQLModel create_all()"""
+    columns = {c["name"] for c in inspector.get_columns("licenses")}
+    if "last_verified" not in columns:
+        op.add_column("licenses", sa.Column("last_verified", sa.DateTime(), nullable=True))
+
+    op.alter_column("licenses", "license_key", server_default=LICENSE_KEY_DEFAULT)
+    op.alter_column("licenses", "tier", server_default="free")
+    op.alter_column("licenses", "is_active", server_default=sa.text("true"))
+    op.alter_column("licenses", "created_at", server_default=sa.text("now()"))
+    op.alter_column("licenses", "updated_at", server_default=sa.text("now()"))
+
+    # create_all made device_id a plain index; it must be unique now
+    op.execute("DROP INDEX IF EXISTS ix_licenses_device_id")
+    op.execute(
+        """
+        UPDATE licenses SET device_id = NULL
+        WHERE id IN (
+            SELECT id FROM (
+                SELECT id, row_number() OVER (
+                    PARTITION BY device_id ORDER BY updated_at DESC NULLS LAST, id DESC
+                ) AS rank
+                FROM licenses
+                WHERE device_id IS NOT NULL
+            ) AS ranked
+            WHERE rank > 1
+        )
+        """
+    )
+
+
+def _copy_legacy_license_rows():
+    op.execute(
+        """
+        INSERT INTO licenses (device_id, email, tier, is_active, iap_store, iap_purchase_token,
+                              expires_at, last_verified, created_at, updated_at)
+        SELECT DISTINCT ON (device_id)
+               device_id, email, COALESCE(tier, 'free'), COALESCE(is_active, false),
+               CASE WHEN iap_purchase_token IS NOT NULL THEN 'google_play' END,
+               iap_purchase_token, expiry_date, last_verified, NOW(), NOW()
+        FROM license
+        WHERE device_id IS NOT NULL
+        ORDER BY device_id, last_verified DESC NULLS LAST
+        ON CONFLICT (device_id) DO NOTHING
+        """
+    )
+    op.rename_table("license", "license_legacy")
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+
+    if "licenses" in tables:
+        _upgrade_create_all_licenses(inspector)
+    else:
+        _create_licenses()
+
+    op.execute("CREATE UNIQUE INDEX IF NOT EXISTS ix_licenses_license_key ON licenses (license_key)")
+    op.execute("CREATE UNIQUE INDEX IF NOT EXISTS ix_licenses_device_id ON licenses (device_id)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_licenses_iap_purchase_token ON licenses (iap_purchase_token)")
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_licenses_active_expires_at ON licenses (expires_at) WHERE is_active"
+    )
+
+    if "license" in tables:
+        _copy_legacy_license_rows()
+
+    if "play_ack_outbox" not in tables:
+        op.create_table(
+            "play_ack_outbox",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("product_id", sa.String(), nullable=False),
+            sa.Column("purchase_token", sa.String(), nullable=False, unique=True),
+            sa.Column("attempts", sa.Integer(), nullable=False, server_default=sa.text("0")),
+            sa.Column(
+                "next_attempt_at", sa.DateTime(), nullable=False,
+                server_default=sa.text("(now() AT TIME ZONE 'utc')")
+            ),
+            sa.Column("last_error", sa.String(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=False, server_default=sa.text("now()")),
+        )
+    else:
+        op.alter_column("play_ack_outbox", "attempts", server_default=sa.text("0"))
+        op.alter_column(
+            "play_ack_outbox", "next_attempt_at",
+            server_default=sa.text("(now() AT TIME ZONE 'utc')")
+        )
+        op.alter_column("play_ack_outbox", "created_at", server_default=sa.text("now()"))
+
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_play_ack_outbox_next_attempt_at ON play_ack_outbox (next_attempt_at)"
+    )
+
+
+def downgrade():
+    # Rows merged from `license` and device_ids detached by the dedupe can't
+    # be told apart from the rest afterwards
+    raise RuntimeError(
+        "0001 merges the legacy license table into licenses and dedupes device_id; "
+        "it cannot be downgraded. Restore from a backup (license_legacy still holds the legacy rows)."
+    )
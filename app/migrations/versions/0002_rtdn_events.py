@@ -0,0 +1,39 @@
+"""Real-time developer notification log
+
+Adds rtdn_events (one row per Pub/Sub message, used to drop redeliveries)
+and licenses.last_notification_at (event time of the newest notification
+applied, used to ignore out-of-order ones).
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("licenses", sa.Column("last_notification_at", sa.DateTime(), nullable=True))
+
+    op.create_table(
+        "rtdn_events",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("message_id", sa.String(), nullable=False, unique=True),
+        sa.Column("purchase_token", sa.String(), nullable=True),
+        sa.Column("product_id", sa.String(), nullable=True),
+        sa.Column("notification_type", sa.Integer(), nullable=True),
+        sa.Column("event_time", sa.DateTime(), nullable=False),
+        sa.Column("received_at", sa.DateTime(), nullable=False, server_default=sa.text("now()")),
+    )
+    op.create_index("ix_rtdn_events_purchase_token", "rtdn_events", ["purchase_token"])
+
+
+def downgrade():
+    op.drop_index("ix_rtdn_events_purchase_token", table_name="rtdn_events")
+    op.drop_table("rtdn_events")
+    op.drop_column("licenses", "last_notification_at")
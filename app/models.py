@@ -1,16 +1,29 @@
 from sqlmodel import SQLModel, Field
+from sqlalchemy import Index, text
 from datetime import datetime
 from typing import Optional
 
 class License(SQLModel, table=True):
     __tablename__ = "licenses"
+    __table_args__ = (
+        # One license per device (ON CONFLICT (device_id) upserts in main.py)
+        Index("ix_licenses_device_id", "device_id", unique=True),
+        # Router looks licenses up by purchase token
+        Index("ix_licenses_iap_purchase_token", "iap_purchase_token"),
+        # Expiry sweeps only scan active rows
+        Index("ix_licenses_active_expires_at", "expires_at", postgresql_where=text("is_active")),
+    )
     
     id: Optional[int] = Field(default=None, primary_key=True)
-    license_key: str = Field(unique=True, index=True)
-    tier: str = Field(default="free")  # free, premium, business
-    device_id: Optional[str] = Field(default=None, index=True)
+    license_key: str = Field(
+        unique=True,
+        index=True,
+        sa_column_kwargs={"server_default": text("'lic_' || replace(gen_random_uuid()::text, '-', '')")}
+    )
+    tier: str = Field(default="free", sa_column_kwargs={"server_default": "free"})  # free, premium, business
+    device_id: Optional[str] = Field(default=None)
     email: Optional[str] = Field(default=None)
-    is_active: bool = Field(default=True)
+    is_active: bool = Field(default=True, sa_column_kwargs={"server_default": text("true")})
     
     # IAP fields
     iap_purchase_token: Optional[str] = Field(default=None)
@@ -20,5 +33,37 @@ class License(SQLModel, table=True):
     # Timestamps
     activated_at: Optional[datetime] = Field(default=None)
     expires_at: Optional[datetime] = Field(default=None)
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-    updated_at: datetime = Field(default_factory=datetime.utcnow)
\ No newline at end of file
+    last_verified: Optional[datetime] = Field(default=None)
+    last_notification_at: Optional[datetime] = Field(default=None)  # newest RTDN event applied
+    created_at: datetime = Field(default_factory=datetime.utcnow, sa_column_kwargs={"server_default": text("now()")})
+    updated_at: datetime = Field(default_factory=datetime.utcnow, sa_column_kwargs={"server_default": text("now()")})
+
+
+class PlayAckOutbox(SQLModel, table=True):
+    """Google Play subscriptions waiting to be acknowledged"""
+    __tablename__ = "play_ack_outbox"
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    product_id: str
+    purchase_token: str = Field(unique=True)
+    attempts: int = Field(default=0, sa_column_kwargs={"server_default": text("0")})
+    next_attempt_at: datetime = Field(
+        default_factory=datetime.utcnow,
+        index=True,
+        sa_column_kwargs={"server_default": text("(now() AT TIME ZONE 'utc')")}
+    )
+    last_error: Optional[str] = Field(default=None)
+    created_at: datetime = Field(default_factory=datetime.utcnow, sa_column_kwargs={"server_default": text("now()")})
+
+
+class RtdnEvent(SQLModel, table=True):
+    """Google Play real-time developer notifications already received"""
+    __tablename__ = "rtdn_events"
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    message_id: str = Field(unique=True)  # Pub/Sub messageId
+    purchase_token: Optional[str] = Field(default=None, index=True)
+    product_id: Optional[str] = Field(default=None)
+    notification_type: Optional[int] = Field(default=None)
+    event_time: datetime
+    received_at: datetime = Field(default_factory=datetime.utcnow, sa_column_kwargs={"server_default": text("now()")})
\ No newline at end of file
@@ -0,0 +1,202 @@
+"""
+Shared keep-alive HTTP client for the Google Play Developer API
+"""
+
+import asyncio
+import os
+import time
+from typing import Optional
+
+import httpx
+
+from .circuit import CircuitBreaker, CircuitOpenError
+from .google_auth import play_token_manager
+from .metrics import PLAY_API_DURATION, PLAY_API_RESPONSES
+
+GOOGLE_PLAY_PACKAGE_NAME = "com.fourdgamimg.prostack"
+# Overridable so benchmarks and local runs can point at a stand-in server
+PLAY_API_BASE_URL = os.getenv(
+    "GOOGLE_PLAY_API_BASE_URL",
+    "https://androidpublisher.googleapis.com/androidpublisher/v3",
+)
+
+# Subscription product -> license tier
+TIER_MAP = {
+    "prostack_premium": "premium",
+    "prostack_premium_yearly": "premium",
+    "prostack_business": "business",
+    "prostack_business_yearly": "business"
+}
+
+# Connection pool limits
+PLAY_HTTP_MAX_CONNECTIONS = int(os.getenv("PLAY_HTTP_MAX_CONNECTIONS", "20"))
+PLAY_HTTP_MAX_KEEPALIVE = int(os.getenv("PLAY_HTTP_MAX_KEEPALIVE", "10"))
+PLAY_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("PLAY_HTTP_KEEPALIVE_EXPIRY", "120"))
+
+# Timeouts (seconds)
+PLAY_HTTP_CONNECT_TIMEOUT = float(os.getenv("PLAY_HTTP_CONNECT_TIMEOUT", "3"))
+PLAY_HTTP_READ_TIMEOUT = float(os.getenv("PLAY_HTTP_READ_TIMEOUT", "10"))
+PLAY_HTTP_WRITE_TIMEOUT = float(os.getenv("PLAY_HTTP_WRITE_TIMEOUT", "5"))
+PLAY_HTTP_POOL_TIMEOUT = float(os.getenv("PLAY_HTTP_POOL_TIMEOUT", "2"))
+
+# Circuit breaker: fail fast after consecutive timeouts / 5xx / 429
+PLAY_BREAKER_FAILURE_THRESHOLD = int(os.getenv("PLAY_BREAKER_FAILURE_THRESHOLD", "5"))
+PLAY_BREAKER_RESET_TIMEOUT = float(os.getenv("PLAY_BREAKER_RESET_TIMEOUT", "30"))
+PLAY_BREAKER_HALF_OPEN_CALLS = int(os.getenv("PLAY_BREAKER_HALF_OPEN_CALLS", "1"))
+PLAY_BREAKER_SLOW_CALL = float(os.getenv("PLAY_BREAKER_SLOW_CALL", "5"))  # seconds
+
+play_breaker = CircuitBreaker(
+    "google_play",
+    failure_threshold=PLAY_BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=PLAY_BREAKER_RESET_TIMEOUT,
+    half_open_max_calls=PLAY_BREAKER_HALF_OPEN_CALLS,
+    slow_call_threshold=PLAY_BREAKER_SLOW_CALL,
+)
+
+_client: Optional[httpx.AsyncClient] = None
+
+# Requests currently waiting on or using a pooled connection
+_in_flight = 0
+_peak_in_flight = 0
+_total_requests = 0
+
+
+def open_play_client() -> httpx.AsyncClient:
+    """Create the shared client (called from the FastAPI lifespan)"""
+    global _client
+
+    if _client is None:
+        _client = httpx.AsyncClient(
+            base_url=PLAY_API_BASE_URL,
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=PLAY_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=PLAY_HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=PLAY_HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(
+                connect=PLAY_HTTP_CONNECT_TIMEOUT,
+                read=PLAY_HTTP_READ_TIMEOUT,
+                write=PLAY_HTTP_WRITE_TIMEOUT,
+                pool=PLAY_HTTP_POOL_TIMEOUT,
+            ),
+            headers={"Content-Type": "application/json"},
+        )
+    return _client
+
+
+async def close_play_client():
+    """Drain keep-alive connections on shutdown"""
+    global _client
+
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_play_client() -> httpx.AsyncClient:
+    """Shared client, created on first use outside the lifespan"""
+    return _client or open_play_client()
+
+
+async def play_request(operation: str, method: str, path: str, **kwargs) -> httpx.Response:
+    """
+    Authorized request against the androidpublisher API.
+
+    Raises CircuitOpenError without calling Google while the breaker is open.
+    """
+    global _in_flight, _peak_in_flight, _total_requests
+
+    try:
+        play_breaker.before_call()
+    except CircuitOpenError:
+        PLAY_API_RESPONSES.labels(operation, "circuit_open").inc()
+        raise
+
+    try:
+        access_token = await play_token_manager.get_token()
+    except BaseException:
+        play_breaker.record(None, 0)
+        raise
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    _in_flight += 1
+    _total_requests += 1
+    _peak_in_flight = max(_peak_in_flight, _in_flight)
+    code = "error"
+    failed = True
+    start = time.perf_counter()
+    try:
+        response = await get_play_client().request(method, path, headers=headers, **kwargs)
+        code = str(response.status_code)
+        failed = is_upstream_failure(response)
+        return response
+    except httpx.TimeoutException:
+        code = "timeout"
+        raise
+    except asyncio.CancelledError:
+        failed = None
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        _in_flight -= 1
+        play_breaker.record(failed, elapsed)
+        PLAY_API_DURATION.labels(operation).observe(elapsed)
+        PLAY_API_RESPONSES.labels(operation, code).inc()
+
+
+def is_upstream_failure(response: httpx.Response) -> bool:
+    """Google-side trouble (throttling, 5xx) as opposed to an answer about the purchase"""
+    return response.status_code == 429 or response.status_code >= 500
+
+
+async def get_subscription(product_id: str, purchase_token: str) -> httpx.Response:
+    """purchases.subscriptions.get"""
+    return await play_request(
+        "get",
+        "GET",
+        f"/applications/{GOOGLE_PLAY_PACKAGE_NAME}/purchases/subscriptions/{product_id}/tokens/{purchase_token}",
+    )
+
+
+async def acknowledge_subscription(product_id: str, purchase_token: str) -> httpx.Response:
+    """purchases.subscriptions.acknowledge"""
+    return await play_request(
+        "acknowledge",
+        "POST",
+        f"/applications/{GOOGLE_PLAY_PACKAGE_NAME}/purchases/subscriptions/{product_id}/tokens/{purchase_token}:acknowledge",
+        json={},
+    )
+
+
+def play_error_message(response: httpx.Response) -> str:
+    """Extract Google's error message from a failed response"""
+    try:
+        return response.json().get("error", {}).get("message") or response.text
+    except ValueError:
+        return response.text or f"HTTP {response.status_code}"
+
+
+def pool_stats() -> dict:
+    """Connection pool saturation for the shared client"""
+    stats = {
+        "open": _client is not None,
+        "max_connections": PLAY_HTTP_MAX_CONNECTIONS,
+        "max_keepalive": PLAY_HTTP_MAX_KEEPALIVE,
+        "in_flight": _in_flight,
+        "peak_in_flight": _peak_in_flight,
+        "total_requests": _total_requests,
+    }
+
+    # httpx has no public pool API; read the httpcore pool defensively
+    pool = getattr(getattr(_client, "_transport", None), "_pool", None)
+    if pool is not None:
+        connections = list(getattr(pool, "connections", []))
+        requests = list(getattr(pool, "_requests", []))
+        stats.update({
+            "connections": len(connections),
+            "idle_connections": sum(1 for c in connections if c.is_idle()),
+            "http2_connections": sum(1 for c in connections if "HTTP/2" in c.info()),
+            "queued_requests": sum(1 for r in requests if r.is_queued()),
+        })
+    return stats
@@ -0,0 +1,88 @@
+"""
+Async Postgres connection pool for the license endpoints
+"""
+
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+
+from .metrics import DB_POOL_WAIT, DB_QUERY_DURATION
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+# Pool sizing (per process)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))  # seconds to wait for a free connection
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))
+
+pool: Optional[AsyncConnectionPool] = None
+
+
+async def open_pool():
+    """Open the connection pool (called from the FastAPI lifespan)"""
+    global pool
+
+    if pool is not None or not DATABASE_URL:
+        return
+
+    pool = AsyncConnectionPool(
+        DATABASE_URL,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        timeout=DB_POOL_TIMEOUT,
+        max_idle=DB_POOL_MAX_IDLE,
+        max_lifetime=DB_POOL_MAX_LIFETIME,
+        kwargs={"row_factory": dict_row},
+        # Run a cheap round trip before handing out a connection so dead
+        # sockets (e.g. after a Railway Postgres restart) are replaced
+        check=AsyncConnectionPool.check_connection,
+        name="license",
+        open=False,
+    )
+    await pool.open(wait=True, timeout=DB_POOL_TIMEOUT)
+
+
+async def close_pool():
+    """Close the connection pool on shutdown"""
+    global pool
+
+    if pool is not None:
+        await pool.close()
+        pool = None
+
+
+@asynccontextmanager
+async def connection():
+    """
+    Borrow a connection from the pool.
+
+    The transaction is committed when the block exits cleanly and rolled
+    back on error. Raises PoolTimeout if no connection frees up within
+    DB_POOL_TIMEOUT seconds.
+    """
+    if pool is None:
+        raise PoolTimeout("Database pool is not open")
+
+    start = time.perf_counter()
+    async with pool.connection() as conn:
+        DB_POOL_WAIT.labels("license").observe(time.perf_counter() - start)
+        yield conn
+
+
+async def execute(conn, query_name: str, sql: str, params=None):
+    """conn.execute() timed under prostack_db_query_duration_seconds{query=...}"""
+    with DB_QUERY_DURATION.labels(query_name).time():
+        return await conn.execute(sql, params)
+
+
+def pool_stats() -> dict:
+    """Current pool counters (size, waiting requests, errors, ...)"""
+    if pool is None:
+        return {"open": False}
+    return {"open": True, **pool.get_stats()}
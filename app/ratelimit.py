@@ -0,0 +1,300 @@
+"""
+Token-bucket rate limiting per API key, device and purchase token
+
+Runs as ASGI middleware ahead of routing, so requests over budget are
+answered with 429 + Retry-After before any database or Google Play work.
+Each limited route has one bucket per identity (API key, device_id,
+purchase token); a request must fit every bucket it touches and only then
+consumes a token from each.
+
+Budgets are "rate:burst" (tokens per second : bucket size) and can be
+overridden per route and key, e.g. RATE_LIMIT_LICENSE_CHECK_DEVICE_ID=0.5:5.
+
+PROSTACK_API_KEY is shared by every installed app, so an api_key budget is
+a fleet-wide cap on the route, not a per-client one: its defaults are sized
+for total traffic and only stop runaway load. Per-client fairness comes
+from the device_id and purchase_token budgets.
+Buckets live in process memory, or in Redis when the shared cache is
+connected (SHARED_CACHE_URL) so every worker draws from the same budget.
+"""
+
+import hashlib
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs
+
+import orjson
+
+from .cache import shared_redis
+from .log import get_logger
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() != "false"
+# Idle buckets beyond this are forgotten (they refill to full anyway)
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Only bodies up to this size are parsed for device_id / purchase_token
+RATE_LIMIT_MAX_BODY = int(os.getenv("RATE_LIMIT_MAX_BODY", "65536"))
+
+logger = get_logger("ratelimit")
+
+
+class Budget(NamedTuple):
+    key: str      # "api_key", "device_id" or "purchase_token"
+    rate: float   # tokens added per second
+    burst: float  # bucket size
+
+
+def _budget(route: str, key: str, default: str) -> Budget:
+    name = f"RATE_LIMIT_{route}_{key}".upper()
+    spec = os.getenv(name, default)
+    try:
+        rate, burst = (float(part) for part in spec.split(":"))
+    except ValueError:
+        raise ValueError(f"{name}={spec!r}: expected 'rate:burst'")
+    # A zero rate never refills (division by zero when computing the wait)
+    # and a burst below 1 never admits a request
+    if not rate > 0 or not burst >= 1:
+        raise ValueError(f"{name}={spec!r}: rate must be > 0 and burst >= 1")
+    return Budget(key, rate, burst)
+
+
+# path -> (route name, budgets, whether identities come from the JSON body);
+# api_key budgets are fleet-wide (see above)
+ROUTE_BUDGETS: Dict[str, Tuple[str, List[Budget], bool]] = {
+    "/api/v1/license/check": ("license_check", [
+        _budget("license_check", "api_key", "5000:10000"),
+        _budget("license_check", "device_id", "1:10"),
+    ], False),
+    "/api/v1/license/check-batch": ("license_check_batch", [
+        _budget("license_check_batch", "api_key", "100:200"),
+    ], False),
+    "/api/v1/subscriptions/verify": ("verify", [
+        _budget("verify", "api_key", "1000:2000"),
+        _budget("verify", "device_id", "0.2:5"),
+        _budget("verify", "purchase_token", "0.2:5"),
+    ], True),
+    "/api/v1/subscriptions/verify-batch": ("verify_batch", [
+        _budget("verify_batch", "api_key", "0.1:2"),
+    ], False),
+}
+
+stats = {
+    "allowed": 0,
+    "limited": 0,
+    "backend_errors": 0,
+}
+
+
+# ==================== Backends ====================
+
+class LocalBuckets:
+    """In-process buckets; each check is O(number of buckets touched)"""
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+
+    async def take(self, checks: List[Tuple[str, Budget]], now: float) -> float:
+        """Consume one token from every bucket, or none; returns seconds to wait (0 = allowed)"""
+        levels = []
+        wait = 0.0
+        for bucket_key, budget in checks:
+            bucket = self._buckets.get(bucket_key)
+            if bucket is None:
+                tokens = budget.burst
+            else:
+                tokens = min(budget.burst, bucket[0] + (now - bucket[1]) * budget.rate)
+            levels.append(tokens)
+            if tokens < 1:
+                wait = max(wait, (1 - tokens) / budget.rate)
+
+        for (bucket_key, _), tokens in zip(checks, levels):
+            self._buckets[bucket_key] = [tokens if wait else tokens - 1, now]
+            self._buckets.move_to_end(bucket_key)
+
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+# Same algorithm as LocalBuckets, atomic across workers
+TAKE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local levels = {}
+local wait = 0
+for i = 1, #KEYS do
+    local rate = tonumber(ARGV[2 * i])
+    local burst = tonumber(ARGV[2 * i + 1])
+    local bucket = redis.call('HMGET', KEYS[i], 't', 'u')
+    local tokens = burst
+    if bucket[1] then
+        tokens = math.min(burst, tonumber(bucket[1]) + math.max(0, now - tonumber(bucket[2])) * rate)
+    end
+    levels[i] = tokens
+    if tokens < 1 then
+        wait = math.max(wait, (1 - tokens) / rate)
+    end
+end
+for i = 1, #KEYS do
+    local rate = tonumber(ARGV[2 * i])
+    local burst = tonumber(ARGV[2 * i + 1])
+    local tokens = levels[i]
+    if wait == 0 then
+        tokens = tokens - 1
+    end
+    redis.call('HSET', KEYS[i], 't', tostring(tokens), 'u', tostring(now))
+    redis.call('PEXPIRE', KEYS[i], math.ceil(burst / rate * 1000) + 1000)
+end
+return tostring(wait)
+"""
+
+
+class RedisBuckets:
+    """Buckets shared by all workers, evaluated in one Lua call per request"""
+
+    def __init__(self, redis, prefix: str = "prostack:ratelimit"):
+        self.prefix = prefix
+        self._script = redis.register_script(TAKE_SCRIPT)
+
+    async def take(self, checks: List[Tuple[str, Budget]], now: float) -> float:
+        keys = [f"{self.prefix}:{bucket_key}" for bucket_key, _ in checks]
+        args = [now]
+        for _, budget in checks:
+            args += [budget.rate, budget.burst]
+        return float(await self._script(keys=keys, args=args))
+
+
+_local = LocalBuckets(RATE_LIMIT_MAX_KEYS)
+_redis_buckets: Optional[RedisBuckets] = None
+
+
+def _backend():
+    global _redis_buckets
+
+    redis = shared_redis()
+    if redis is None:
+        return _local
+    if _redis_buckets is None:
+        _redis_buckets = RedisBuckets(redis)
+    return _redis_buckets
+
+
+async def take(checks: List[Tuple[str, Budget]]) -> float:
+    """Charge the buckets; falls back to local buckets if Redis is unavailable"""
+    now = time.time()
+    backend = _backend()
+    try:
+        return await backend.take(checks, now)
+    except Exception:
+        if backend is _local:
+            raise
+        stats["backend_errors"] += 1
+        logger.warning("Shared rate limit backend failed, using local buckets")
+        return await _local.take(checks, now)
+
+
+# ==================== Middleware ====================
+
+def _identity(value: str) -> str:
+    # Fixed-size bucket keys, and no API keys or tokens stored in Redis
+    return hashlib.blake2b(value.encode(), digest_size=12).hexdigest()
+
+
+class RateLimitMiddleware:
+    """429 + Retry-After for requests over their route's budgets"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not RATE_LIMIT_ENABLED:
+            return await self.app(scope, receive, send)
+
+        route = ROUTE_BUDGETS.get(scope["path"])
+        if route is None:
+            return await self.app(scope, receive, send)
+        route_name, budgets, from_body = route
+
+        identities = {}
+        for key, value in scope["headers"]:
+            if key == b"x-api-key":
+                identities["api_key"] = value.decode("latin-1")
+                break
+
+        if scope.get("query_string"):
+            query = parse_qs(scope["query_string"].decode("latin-1"))
+            for name in ("device_id", "purchase_token"):
+                if name in query:
+                    identities[name] = query[name][0]
+
+        if from_body:
+            receive = await self._buffer_body(receive, identities)
+
+        checks = [
+            (f"{route_name}:{budget.key}:{_identity(identities[budget.key])}", budget)
+            for budget in budgets
+            if identities.get(budget.key)
+        ]
+        wait = await take(checks) if checks else 0
+
+        if not wait:
+            stats["allowed"] += 1
+            return await self.app(scope, receive, send)
+
+        stats["limited"] += 1
+        stats[f"limited_{route_name}"] = stats.get(f"limited_{route_name}", 0) + 1
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"retry-after", str(max(1, math.ceil(wait))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": b'{"detail":"Rate limit exceeded"}'})
+
+    async def _buffer_body(self, receive, identities: dict):
+        """
+        Read up to RATE_LIMIT_MAX_BODY bytes of the request body for its
+        identities and return a receive that replays them; anything beyond
+        is left in the stream for the app to read.
+        """
+        chunks = []
+        size = 0
+        more = True
+        while more and size <= RATE_LIMIT_MAX_BODY:
+            message = await receive()
+            if message["type"] != "http.request":
+                # Client went away; let the app see the disconnect
+                return self._replay(chunks, False, message, receive)
+            chunks.append(message.get("body", b""))
+            size += len(chunks[-1])
+            more = message.get("more_body", False)
+
+        if not more and size <= RATE_LIMIT_MAX_BODY:
+            try:
+                body = orjson.loads(b"".join(chunks))
+            except orjson.JSONDecodeError:
+                body = None
+            if isinstance(body, dict):
+                for name in ("device_id", "purchase_token"):
+                    if isinstance(body.get(name), str):
+                        identities[name] = body[name]
+
+        return self._replay(chunks, more, None, receive)
+
+    @staticmethod
+    def _replay(chunks: List[bytes], more_body: bool, final: Optional[dict], original_receive):
+        pending = [{"type": "http.request", "body": b"".join(chunks), "more_body": more_body}]
+        if final is not None:
+            pending.append(final)
+
+        async def receive():
+            if pending:
+                return pending.pop(0)
+            # Rest of an oversized body, then the real disconnect
+            return await original_receive()
+
+        return receive
@@ -1,25 +1,35 @@
 # app/routers/iap.py - ProStack IAP Verification
 
 import os
-import json
 import secrets
 from datetime import datetime
 from fastapi import APIRouter, HTTPException, Depends, Header
 from pydantic import BaseModel
-from sqlmodel import Session, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from typing import Optional
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
 
-from ..db import get_session
-from ..models import License
+from .. import ack_queue
+from ..cache import license_cache, verification_cache, cache_verification
+from ..circuit import CircuitOpenError
+from ..db import get_async_session, new_async_session
+from ..log import get_logger
+from ..google_auth import play_token_manager
+from ..entitlements import verify_with_fallback
+from ..models import License, PlayAckOutbox
+from ..play_client import get_subscription, is_upstream_failure, play_error_message
+from ..singleflight import SingleFlight
 
 router = APIRouter(prefix="/api/v1/subscriptions", tags=["subscriptions"])
 
 # ProStack API Key from environment
 PROSTACK_API_KEY = os.getenv("PROSTACK_API_KEY", "change-me-in-production")
 
+verify_flights = SingleFlight("router_verify")
+
+logger = get_logger("iap")
+
 
 class PurchaseVerificationRequest(BaseModel):
     product_id: str
@@ -33,122 +43,136 @@ class PurchaseVerificationResponse(BaseModel):
     subscription_tier: Optional[str] = None
     expiry_date: Optional[str] = None
     message: str
+    stale: bool = False  # last known state, Google Play was unavailable
 
 
-def verify_google_play_purchase(product_id: str, purchase_token: str) -> dict:
+async def verify_google_play_purchase(product_id: str, purchase_token: str) -> dict:
     """
-    Verify Google Play purchase receipt with Google's servers
+    Verify Google Play purchase receipt with Google's servers, or answer with
+    the stored license when Google is down or slow
     """
+    cached = await verification_cache.get((product_id, purchase_token))
+    if cached is not None:
+        return dict(cached)
+    
+    return await verify_with_fallback(
+        product_id,
+        purchase_token,
+        lambda: _fetch_google_play_purchase(product_id, purchase_token)
+    )
+
+
+async def _fetch_google_play_purchase(product_id: str, purchase_token: str) -> dict:
+    if not play_token_manager.configured:
+        return {"valid": False, "error": "GOOGLE_SERVICE_ACCOUNT_JSON environment variable not set"}
+    
     try:
-        # Load service account credentials from environment variable
-        service_account_json = os.getenv('GOOGLE_SERVICE_ACCOUNT_JSON')
-        
-        if not service_account_json:
-            raise Exception("GOOGLE_SERVICE_ACCOUNT_JSON environment variable not set")
-        
-        print("📱 Loading Google service account from environment")
-        
-        # Parse JSON and create credentials
-        credentials_dict = json.loads(service_account_json)
-        credentials = service_account.Credentials.from_service_account_info(
-            credentials_dict,
-            scopes=['https://www.googleapis.com/auth/androidpublisher']
-        )
+        # Verify subscription with Google (shared keep-alive client, cached token)
+        response = await get_subscription(product_id, purchase_token)
         
-        # Build the API client
-        service = build('androidpublisher', 'v3', credentials=credentials)
-        print("✅ Google Play API client initialized")
-        
-        # ProStack package name from Google Play Console
-        package_name = "com.fourdgamimg.prostack"
-        
-        print(f"🔍 Verifying subscription: {product_id}")
-        print(f"📝 Token: {purchase_token[:20]}...")
-        
-        # Verify subscription with Google
-        result = service.purchases().subscriptions().get(
-            packageName=package_name,
-            subscriptionId=product_id,
-            token=purchase_token
-        ).execute()
+        if response.status_code != 200:
+            error_msg = play_error_message(response)
+            logger.warning(
+                "Google Play API error",
+                extra={"fields": {"product_id": product_id, "status": response.status_code, "error": error_msg}}
+            )
+            
+            if response.status_code == 410:
+                return {"valid": False, "error": "Subscription has been canceled or refunded", "definitive": True}
+            elif response.status_code == 404:
+                return {"valid": False, "error": "Purchase not found", "definitive": True}
+            else:
+                return {
+                    "valid": False,
+                    "error": f"Verification failed: {error_msg}",
+                    "retryable": is_upstream_failure(response)
+                }
         
-        print(f"✅ Google Play verification successful!")
-        print(f"   Order ID: {result.get('orderId')}")
-        print(f"   Payment State: {result.get('paymentState')}")
-        print(f"   Auto-Renewing: {result.get('autoRenewing')}")
+        result = response.json()
         
         # Check expiry
         expiry_ms = int(result.get('expiryTimeMillis', 0))
         expiry_date = datetime.fromtimestamp(expiry_ms / 1000) if expiry_ms else None
         
-        if expiry_date:
-            is_active = expiry_date > datetime.utcnow()
-            print(f"   Expires: {expiry_date}")
-            print(f"   Active: {is_active}")
-        else:
-            is_active = False
+        is_active = expiry_date > datetime.utcnow() if expiry_date else False
         
-        # Acknowledge the purchase (required by Google within 3 days)
-        try:
-            service.purchases().subscriptions().acknowledge(
-                packageName=package_name,
-                subscriptionId=product_id,
-                token=purchase_token,
-                body={}
-            ).execute()
-            print("✅ Subscription acknowledged")
-        except HttpError as e:
-            if e.resp.status == 400:
-                print("ℹ️ Subscription already acknowledged")
-            else:
-                print(f"⚠️ Acknowledgment warning: {e}")
+        logger.debug(
+            "Google Play verification successful",
+            extra={"fields": {
+                "product_id": product_id,
+                "order_id": result.get('orderId'),
+                "payment_state": result.get('paymentState'),
+                "auto_renewing": result.get('autoRenewing'),
+                "expires": expiry_date,
+                "active": is_active,
+            }}
+        )
         
-        return {
+        verification = {
             "valid": True,
             "is_active": is_active,
             "expiry_date": expiry_date.isoformat() if expiry_date else None,
             "order_id": result.get('orderId'),
             "payment_state": result.get('paymentState'),
-            "auto_renewing": result.get('autoRenewing', False)
+            "auto_renewing": result.get('autoRenewing', False),
+            "definitive": True
         }
+        # Cached without the acknowledgement state: this call queues the ack,
+        # cache hits must not queue it again
+        await cache_verification(product_id, purchase_token, dict(verification), expiry_ms)
         
-    except HttpError as e:
-        error_content = json.loads(e.content.decode('utf-8'))
-        error_msg = error_content.get('error', {}).get('message', str(e))
-        print(f"❌ Google Play API error: {error_msg}")
-        
-        if e.resp.status == 410:
-            return {"valid": False, "error": "Subscription has been canceled or refunded"}
-        elif e.resp.status == 404:
-            return {"valid": False, "error": "Purchase not found"}
-        else:
-            return {"valid": False, "error": f"Verification failed: {error_msg}"}
+        # 0 = yet to be acknowledged, 1 = acknowledged
+        verification["acknowledgement_state"] = result.get('acknowledgementState', 0)
+        return verification
+    
+    except CircuitOpenError:
+        logger.warning("Google Play circuit open, verification skipped", extra={"fields": {"product_id": product_id}})
+        return {"valid": False, "error": "Google Play temporarily unavailable", "retryable": True}
     
     except Exception as e:
-        print(f"❌ Verification error: {e}")
-        return {"valid": False, "error": str(e)}
+        logger.exception("Verification error", extra={"fields": {"product_id": product_id}})
+        return {"valid": False, "error": str(e), "retryable": True}
 
 
 @router.post("/verify", response_model=PurchaseVerificationResponse)
 async def verify_purchase(
     request: PurchaseVerificationRequest,
-    db: Session = Depends(get_session),
     api_key: str = Header(..., alias="X-API-Key")
 ):
     """
     Verify in-app purchase and update license in database
     """
-    print(f"\n{'='*60}")
-    print(f"🔍 IAP VERIFICATION REQUEST")
-    print(f"{'='*60}")
-    print(f"Platform: {request.platform}")
-    print(f"Product ID: {request.product_id}")
-    print(f"Token length: {len(request.purchase_token)} bytes")
+    logger.debug(
+        "IAP verification request",
+        extra={"fields": {
+            "platform": request.platform,
+            "product_id": request.product_id,
+            "token_length": len(request.purchase_token),
+        }}
+    )
     
     # Verify API key
     if api_key != PROSTACK_API_KEY:
         raise HTTPException(status_code=401, detail="Invalid API key")
     
+    # Identical concurrent requests (app retries, several screens at once)
+    # wait on the first one instead of repeating the Google call and upsert.
+    # The flight owns its session, so no caller's request-scoped session is
+    # shared with (or closed under) the others.
+    return await verify_flights.do(
+        (request.platform, request.product_id, request.purchase_token),
+        _verify_purchase_in_session,
+        request
+    )
+
+
+async def _verify_purchase_in_session(request: PurchaseVerificationRequest) -> PurchaseVerificationResponse:
+    async with new_async_session() as db:
+        return await _verify_purchase(request, db)
+
+
+async def _verify_purchase(request: PurchaseVerificationRequest, db: AsyncSession) -> PurchaseVerificationResponse:
+    """Verify with the store and upsert the license (run once per in-flight token)"""
     # Map product IDs to tiers
     tier_mapping = {
         'prostack_premium': 'premium',
@@ -168,9 +192,7 @@ async def verify_purchase(
     
     # Verify with Google Play
     if request.platform == "android":
-        print(f"\n📱 Verifying with Google Play...")
-        
-        verification = verify_google_play_purchase(
+        verification = await verify_google_play_purchase(
             product_id=request.product_id,
             purchase_token=request.purchase_token
         )
@@ -182,27 +204,33 @@ async def verify_purchase(
                 message=verification.get("error", "Purchase verification failed")
             )
         
+        if verification.get("stale"):
+            # Last known state from our own records; nothing new to store
+            return PurchaseVerificationResponse(
+                success=True,
+                is_valid=verification.get("is_active", False),
+                subscription_tier=tier,
+                expiry_date=verification.get("expiry_date"),
+                message="Google Play unavailable, last known license state",
+                stale=True
+            )
+        
         is_active = verification.get("is_active", False)
         expiry_date_str = verification.get("expiry_date")
         expiry_date = datetime.fromisoformat(expiry_date_str.replace('Z', '+00:00')) if expiry_date_str else None
         
-        print(f"✅ Verified! Active: {is_active}")
-        
         # Find or create license by purchase token
-        existing_license = db.exec(
+        existing_license = (await db.exec(
             select(License).where(License.iap_purchase_token == request.purchase_token)
-        ).first()
+        )).first()
         
         if existing_license:
-            print(f"📝 Updating existing license")
             existing_license.tier = tier
             existing_license.is_active = is_active
             existing_license.expires_at = expiry_date
             existing_license.iap_product_id = request.product_id
             existing_license.updated_at = datetime.utcnow()
-            license_key = existing_license.license_key
         else:
-            print(f"🆕 Creating new license")
             license_key = f"lic_{secrets.token_urlsafe(32)}"
             
             new_license = License(
@@ -217,16 +245,35 @@ async def verify_purchase(
             )
             db.add(new_license)
         
-        db.commit()
+        # Acknowledge (required by Google within 3 days) from the background
+        # queue; the outbox row commits together with the license
+        needs_ack = verification.get("acknowledgement_state") == 0
+        if needs_ack:
+            await db.execute(
+                pg_insert(PlayAckOutbox)
+                .values(product_id=request.product_id, purchase_token=request.purchase_token)
+                .on_conflict_do_nothing(index_elements=["purchase_token"])
+            )
         
-        print(f"\n{'='*60}")
-        print(f"✅ IAP VERIFICATION COMPLETE")
-        print(f"{'='*60}")
-        print(f"License Key: {license_key[:20]}...")
-        print(f"Tier: {tier}")
-        print(f"Active: {is_active}")
-        print(f"Expires: {expiry_date}")
-        print(f"{'='*60}\n")
+        await db.commit()
+        
+        # Licenses merged from the device-keyed table are served by /license/check
+        if existing_license and existing_license.device_id:
+            await license_cache.invalidate(existing_license.device_id)
+        
+        if needs_ack:
+            ack_queue.notify()
+        
+        logger.info(
+            "IAP verification complete",
+            extra={"fields": {
+                "product_id": request.product_id,
+                "license": "updated" if existing_license else "created",
+                "tier": tier,
+                "active": is_active,
+                "expires": expiry_date,
+            }}
+        )
         
         return PurchaseVerificationResponse(
             success=True,
@@ -254,14 +301,14 @@ async def verify_purchase(
 @router.get("/check/{license_key}")
 async def check_license(
     license_key: str,
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_async_session)
 ):
     """
     Check license status (for app to verify subscription)
     """
-    license = db.exec(
+    license = (await db.exec(
         select(License).where(License.license_key == license_key)
-    ).first()
+    )).first()
     
     if not license:
         return {
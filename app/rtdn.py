@@ -0,0 +1,361 @@
+"""
+Google Play Real-time Developer Notifications (RTDN)
+
+Play publishes subscription state changes to Pub/Sub, which pushes them to
+/api/v1/rtdn/push. Each notification is resolved to a license update and
+handed to a micro-batcher that applies concurrent pushes in one transaction:
+the Pub/Sub message IDs are recorded in rtdn_events (duplicates are
+skipped) and the licenses are updated with a single set-based statement.
+licenses.last_notification_at guards against out-of-order delivery, so
+replaying any notification is a no-op.
+
+Pushes are refused unless they can be authenticated: either a shared secret
+on the push URL (RTDN_PUSH_TOKEN, ?token=...) or the OIDC token Pub/Sub
+signs for an authenticated push subscription (RTDN_PUSH_AUDIENCE, optionally
+pinned to RTDN_PUSH_SERVICE_ACCOUNT).
+"""
+
+import asyncio
+import base64
+import json
+import os
+import secrets
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import httpx
+
+from .cache import license_cache, invalidate_verification
+from .log import get_logger
+from .play_client import GOOGLE_PLAY_PACKAGE_NAME, TIER_MAP, get_subscription, play_error_message
+from .pool import connection, execute
+
+RTDN_BATCH_SIZE = int(os.getenv("RTDN_BATCH_SIZE", "200"))
+RTDN_BATCH_MAX_DELAY = float(os.getenv("RTDN_BATCH_MAX_DELAY", "0.05"))  # seconds
+
+# Shared secret on the Pub/Sub push subscription URL (?token=...)
+RTDN_PUSH_TOKEN = os.getenv("RTDN_PUSH_TOKEN")
+# Audience of the push subscription's OIDC token (usually the push URL)
+RTDN_PUSH_AUDIENCE = os.getenv("RTDN_PUSH_AUDIENCE")
+# Service account the push subscription signs as; any, if unset
+RTDN_PUSH_SERVICE_ACCOUNT = os.getenv("RTDN_PUSH_SERVICE_ACCOUNT")
+
+GOOGLE_OIDC_CERTS_URL = "https://www.googleapis.com/oauth2/v1/certs"
+GOOGLE_OIDC_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+OIDC_CERTS_TTL = 3600  # seconds
+
+logger = get_logger("rtdn")
+
+# subscriptionNotification.notificationType
+SUBSCRIPTION_RECOVERED = 1
+SUBSCRIPTION_RENEWED = 2
+SUBSCRIPTION_CANCELED = 3
+SUBSCRIPTION_PURCHASED = 4
+SUBSCRIPTION_ON_HOLD = 5
+SUBSCRIPTION_IN_GRACE_PERIOD = 6
+SUBSCRIPTION_RESTARTED = 7
+SUBSCRIPTION_DEFERRED = 9
+SUBSCRIPTION_PAUSED = 10
+SUBSCRIPTION_REVOKED = 12
+SUBSCRIPTION_EXPIRED = 13
+
+# Expiry may have moved - read the new state from Play once per notification.
+# On hold, paused and revoked are confirmed there too: they are not final
+# (a hold can recover, a pause resumes) and the push alone is no proof.
+REFRESH_TYPES = {
+    SUBSCRIPTION_RECOVERED,
+    SUBSCRIPTION_RENEWED,
+    SUBSCRIPTION_CANCELED,  # still entitled until the paid period ends
+    SUBSCRIPTION_PURCHASED,
+    SUBSCRIPTION_ON_HOLD,
+    SUBSCRIPTION_IN_GRACE_PERIOD,
+    SUBSCRIPTION_RESTARTED,
+    SUBSCRIPTION_DEFERRED,
+    SUBSCRIPTION_PAUSED,
+    SUBSCRIPTION_REVOKED,
+}
+# Entitlement has ended for good - no Play call needed
+DEACTIVATE_TYPES = {
+    SUBSCRIPTION_EXPIRED,
+}
+
+stats = {
+    "received": 0,
+    "duplicates": 0,
+    "applied": 0,
+    "skipped": 0,
+    "batches": 0,
+}
+
+
+class InvalidNotification(ValueError):
+    """The push body is not a Play developer notification for this app"""
+
+
+# ==================== Push Authentication ====================
+
+_oidc_certs: Optional[dict] = None
+_oidc_certs_fetched_at = 0.0
+
+
+def push_auth_configured() -> bool:
+    return bool(RTDN_PUSH_TOKEN or RTDN_PUSH_AUDIENCE)
+
+
+async def _google_oidc_certs() -> dict:
+    global _oidc_certs, _oidc_certs_fetched_at
+
+    if _oidc_certs is None or time.monotonic() - _oidc_certs_fetched_at > OIDC_CERTS_TTL:
+        async with httpx.AsyncClient(timeout=5) as client:
+            response = await client.get(GOOGLE_OIDC_CERTS_URL)
+            response.raise_for_status()
+        _oidc_certs = response.json()
+        _oidc_certs_fetched_at = time.monotonic()
+    return _oidc_certs
+
+
+async def _verify_oidc(authorization: Optional[str]) -> bool:
+    if not authorization or not authorization.startswith("Bearer "):
+        return False
+
+    # google-auth is only needed here; import on first use
+    from google.auth import jwt
+
+    try:
+        claims = jwt.decode(
+            authorization[len("Bearer "):],
+            certs=await _google_oidc_certs(),
+            audience=RTDN_PUSH_AUDIENCE,
+        )
+    except ValueError as e:
+        logger.warning("Rejected RTDN push token", extra={"fields": {"error": str(e)}})
+        return False
+
+    if claims.get("iss") not in GOOGLE_OIDC_ISSUERS:
+        return False
+    if RTDN_PUSH_SERVICE_ACCOUNT:
+        return claims.get("email") == RTDN_PUSH_SERVICE_ACCOUNT and bool(claims.get("email_verified"))
+    return True
+
+
+async def authorize_push(token: Optional[str], authorization: Optional[str]) -> bool:
+    """True if the push carries the URL secret or a valid Pub/Sub OIDC token"""
+    if RTDN_PUSH_TOKEN and token and secrets.compare_digest(token, RTDN_PUSH_TOKEN):
+        return True
+    if RTDN_PUSH_AUDIENCE:
+        return await _verify_oidc(authorization)
+    return False
+
+
+class LicenseUpdate(NamedTuple):
+    message_id: str
+    purchase_token: Optional[str]
+    product_id: Optional[str]
+    notification_type: Optional[int]
+    event_time: datetime
+    is_active: Optional[bool]  # None: record the event, leave the license alone
+    tier: Optional[str]
+    expires_at: Optional[datetime]
+
+
+def decode_push(envelope: dict) -> tuple:
+    """Pub/Sub push envelope -> (message_id, DeveloperNotification dict)"""
+    message = envelope.get("message") if isinstance(envelope, dict) else None
+    if not isinstance(message, dict):
+        raise InvalidNotification("Not a Pub/Sub push message")
+    message_id = message.get("messageId") or message.get("message_id")
+    if not message_id or "data" not in message:
+        raise InvalidNotification("Not a Pub/Sub push message")
+
+    try:
+        notification = json.loads(base64.b64decode(message["data"]))
+    except (ValueError, TypeError) as e:
+        raise InvalidNotification(f"Undecodable message data: {e}")
+
+    if not isinstance(notification, dict):
+        raise InvalidNotification("Message data is not a developer notification")
+    if notification.get("packageName") != GOOGLE_PLAY_PACKAGE_NAME:
+        raise InvalidNotification(f"Unexpected package {notification.get('packageName')!r}")
+    return message_id, notification
+
+
+async def resolve(message_id: str, notification: dict) -> LicenseUpdate:
+    """Turn a notification into the license change it implies"""
+    try:
+        event_time = datetime.fromtimestamp(int(notification.get("eventTimeMillis", 0)) / 1000)
+    except (ValueError, TypeError, OverflowError, OSError) as e:
+        raise InvalidNotification(f"Malformed eventTimeMillis: {e}")
+    subscription = notification.get("subscriptionNotification")
+    if subscription is not None and not isinstance(subscription, dict):
+        raise InvalidNotification("Malformed subscriptionNotification")
+
+    if not subscription:
+        # Test, one-time product and voided purchase notifications are only recorded
+        return LicenseUpdate(message_id, None, None, None, event_time, None, None, None)
+
+    token = subscription.get("purchaseToken")
+    product_id = subscription.get("subscriptionId")
+    notification_type = subscription.get("notificationType")
+    if not token or not product_id or not isinstance(notification_type, int):
+        raise InvalidNotification("Incomplete subscriptionNotification")
+    update = LicenseUpdate(message_id, token, product_id, notification_type, event_time, None, None, None)
+
+    if notification_type in DEACTIVATE_TYPES:
+        return update._replace(is_active=False)
+
+    if notification_type not in REFRESH_TYPES:
+        return update
+
+    response = await get_subscription(product_id, token)
+    if response.status_code == 410:
+        return update._replace(is_active=False)
+    if response.status_code == 404:
+        logger.warning("RTDN for unknown purchase token", extra={"fields": {"product_id": product_id}})
+        return update
+    if response.status_code != 200:
+        # Raise so the push is answered with 5xx and Pub/Sub redelivers it
+        raise RuntimeError(f"Google Play API error {response.status_code}: {play_error_message(response)}")
+
+    data = response.json()
+    expires_at = datetime.fromtimestamp(int(data.get("expiryTimeMillis", 0)) / 1000)
+    return update._replace(
+        is_active=expires_at > datetime.now(),
+        tier=TIER_MAP.get(product_id, "free"),
+        expires_at=expires_at,
+    )
+
+
+async def apply_updates(updates: List[LicenseUpdate]):
+    """Record the events and apply the new ones to licenses in one transaction"""
+    async with connection() as conn:
+        cur = await execute(
+            conn,
+            "rtdn_events_insert",
+            """
+            INSERT INTO rtdn_events (message_id, purchase_token, product_id, notification_type, event_time)
+            SELECT * FROM unnest(%s::text[], %s::text[], %s::text[], %s::int[], %s::timestamp[])
+            ON CONFLICT (message_id) DO NOTHING
+            RETURNING message_id
+            """,
+            (
+                [u.message_id for u in updates],
+                [u.purchase_token for u in updates],
+                [u.product_id for u in updates],
+                [u.notification_type for u in updates],
+                [u.event_time for u in updates],
+            )
+        )
+        new_ids = {row["message_id"] for row in await cur.fetchall()}
+        stats["duplicates"] += len({u.message_id for u in updates} - new_ids)
+
+        # Latest event per token wins; older ones are superseded within the batch too
+        latest: Dict[str, LicenseUpdate] = {}
+        for update in updates:
+            if update.message_id not in new_ids or update.is_active is None:
+                continue
+            current = latest.get(update.purchase_token)
+            if current is None or update.event_time > current.event_time:
+                latest[update.purchase_token] = update
+
+        if not latest:
+            return
+
+        changes = list(latest.values())
+        cur = await execute(
+            conn,
+            "license_apply_rtdn",
+            """
+            UPDATE licenses AS l SET
+                is_active = v.is_active,
+                tier = CASE WHEN v.is_active THEN COALESCE(v.tier, l.tier) ELSE 'free' END,
+                expires_at = COALESCE(v.expires_at, l.expires_at),
+                last_verified = CASE WHEN v.expires_at IS NULL THEN l.last_verified ELSE NOW() END,
+                last_notification_at = v.event_time,
+                updated_at = NOW()
+            FROM unnest(%s::text[], %s::bool[], %s::text[], %s::timestamp[], %s::timestamp[])
+                AS v(purchase_token, is_active, tier, expires_at, event_time)
+            WHERE l.iap_purchase_token = v.purchase_token
+              AND (l.last_notification_at IS NULL OR l.last_notification_at < v.event_time)
+            RETURNING l.device_id, l.iap_purchase_token
+            """,
+            (
+                [u.purchase_token for u in changes],
+                [u.is_active for u in changes],
+                [u.tier for u in changes],
+                [u.expires_at for u in changes],
+                [u.event_time for u in changes],
+            )
+        )
+        rows = await cur.fetchall()
+
+    applied_tokens = {row["iap_purchase_token"] for row in rows}
+    stats["applied"] += len(applied_tokens)
+    # No license carries the token yet, or it already saw a newer event
+    stats["skipped"] += len(set(latest) - applied_tokens)
+
+    await license_cache.invalidate_many(row["device_id"] for row in rows if row["device_id"])
+    for token in latest:
+        await invalidate_verification(token)
+
+
+class MicroBatcher:
+    """
+    Collect items submitted within max_delay (or until max_size) and hand
+    them to one call of apply_batch. Each submitter awaits the outcome of the
+    batch its item landed in, so failures still reach the caller.
+    """
+
+    def __init__(self, apply_batch: Callable, max_size: int, max_delay: float):
+        self.apply_batch = apply_batch
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self._pending: List[tuple] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self._flush)
+
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch: List[tuple]):
+        stats["batches"] += 1
+        try:
+            await self.apply_batch([item for item, _ in batch])
+        except Exception as e:
+            logger.exception("Applying RTDN batch failed", extra={"fields": {"size": len(batch)}})
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+                    # Retrieved here in case the submitter was cancelled
+                    future.exception()
+        else:
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(None)
+
+
+batcher = MicroBatcher(apply_updates, RTDN_BATCH_SIZE, RTDN_BATCH_MAX_DELAY)
+
+
+async def handle_push(envelope: dict):
+    """Apply one Pub/Sub push; returning normally lets the endpoint ack it"""
+    message_id, notification = decode_push(envelope)
+    stats["received"] += 1
+    update = await resolve(message_id, notification)
+    await batcher.submit(update)
+
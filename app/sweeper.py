@@ -0,0 +1,62 @@
+"""
+Background sweeper that downgrades expired licenses
+"""
+
+import asyncio
+import os
+
+from .cache import license_cache
+from .log import get_logger
+from .pool import connection, execute
+
+LICENSE_SWEEP_INTERVAL = float(os.getenv("LICENSE_SWEEP_INTERVAL", "300"))
+LICENSE_SWEEP_BATCH_SIZE = int(os.getenv("LICENSE_SWEEP_BATCH_SIZE", "500"))
+
+logger = get_logger("sweeper")
+
+stats = {
+    "runs": 0,
+    "expired": 0,
+}
+
+
+async def expire_due_licenses(batch_size: int = LICENSE_SWEEP_BATCH_SIZE) -> int:
+    """Downgrade one batch of expired licenses; returns how many changed"""
+    async with connection() as conn:
+        cur = await execute(
+            conn,
+            "license_expire_batch",
+            """
+            UPDATE licenses SET is_active = false, tier = 'free', updated_at = NOW()
+            WHERE id IN (
+                SELECT id FROM licenses
+                WHERE is_active AND expires_at < LOCALTIMESTAMP
+                ORDER BY expires_at
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING device_id
+            """,
+            (batch_size,)
+        )
+        rows = await cur.fetchall()
+
+    await license_cache.invalidate_many(row["device_id"] for row in rows if row["device_id"])
+
+    stats["expired"] += len(rows)
+    return len(rows)
+
+
+async def run_expiry_sweeper():
+    """Sweep every LICENSE_SWEEP_INTERVAL seconds until cancelled"""
+    while True:
+        try:
+            stats["runs"] += 1
+            while await expire_due_licenses() >= LICENSE_SWEEP_BATCH_SIZE:
+                pass
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("License expiry sweep failed")
+
+        await asyncio.sleep(LICENSE_SWEEP_INTERVAL)
@@ -0,0 +1,146 @@
+"""
+Achievement enhancement: one GPT call per job vs one batched call per resume
+
+Runs both paths of app.main_backup against the real OpenAI API on the same
+sample resume and reports, per path, wall-clock latency, number of calls,
+prompt / completion tokens (from the API's usage) and how many jobs came
+back unchanged (fallback to the original bullets).
+
+    export OPENAI_API_KEY=...
+    python -m bench.achievement_batching --jobs 5 --rounds 5 --output achievement_batching.json
+
+Rounds alternate between the two paths so drift in API latency hits both.
+Every round is a billed API call per path; keep --rounds small.
+Run from the repository root.
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import time
+from typing import List
+
+from app import main_backup
+from app.main_backup import WorkExperience, enhance_achievements, enhance_achievements_batch
+from bench.json_encoding import resume_payload
+
+PATHS = ("per_job", "batched")
+
+
+class UsageRecorder:
+    """Wraps main_backup.chat_completion to count calls and tokens"""
+
+    def __init__(self, chat_completion):
+        self._chat_completion = chat_completion
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    async def __call__(self, *args, **kwargs):
+        response = await self._chat_completion(*args, **kwargs)
+        self.calls += 1
+        if response.usage is not None:
+            self.prompt_tokens += response.usage.prompt_tokens
+            self.completion_tokens += response.usage.completion_tokens
+        return response
+
+
+def sample_experiences(jobs: int, bullets: int) -> List[WorkExperience]:
+    experiences = resume_payload(jobs)["resume_data"]["work_experience"]
+    for exp in experiences:
+        exp["achievements"] = exp["achievements"][:bullets]
+    return [WorkExperience(**exp) for exp in experiences]
+
+
+async def run_path(path: str, experiences: List[WorkExperience]) -> List[List[str]]:
+    if path == "batched":
+        return await enhance_achievements_batch(experiences)
+    return list(await asyncio.gather(*(
+        enhance_achievements(exp.achievements, exp.title) for exp in experiences
+    )))
+
+
+async def measure(jobs: int, bullets: int, rounds: int) -> dict:
+    recorder = UsageRecorder(main_backup.chat_completion)
+    main_backup.chat_completion = recorder
+    experiences = sample_experiences(jobs, bullets)
+
+    samples = {path: [] for path in PATHS}
+    for _ in range(rounds):
+        for path in PATHS:
+            recorder.reset()
+            start = time.perf_counter()
+            improved = await run_path(path, experiences)
+            elapsed = time.perf_counter() - start
+            samples[path].append({
+                "latency_s": elapsed,
+                "calls": recorder.calls,
+                "prompt_tokens": recorder.prompt_tokens,
+                "completion_tokens": recorder.completion_tokens,
+                "unchanged_jobs": sum(
+                    new == exp.achievements for new, exp in zip(improved, experiences)
+                ),
+            })
+    await main_backup.get_openai().close()
+
+    results = {}
+    for path, runs in samples.items():
+        latencies = [run["latency_s"] for run in runs]
+        results[path] = {
+            "latency_p50_s": round(statistics.median(latencies), 3),
+            "latency_max_s": round(max(latencies), 3),
+            **{
+                key: round(statistics.mean(run[key] for run in runs), 1)
+                for key in ("calls", "prompt_tokens", "completion_tokens", "unchanged_jobs")
+            },
+        }
+    return results
+
+
+def print_results(results: dict):
+    header = f"{'path':<10}{'p50 s':>9}{'max s':>9}{'calls':>8}{'prompt':>9}{'completion':>12}{'unchanged':>11}"
+    print(header)
+    for path, r in results.items():
+        print(
+            f"{path:<10}{r['latency_p50_s']:>9.2f}{r['latency_max_s']:>9.2f}{r['calls']:>8.1f}"
+            f"{r['prompt_tokens']:>9.0f}{r['completion_tokens']:>12.0f}{r['unchanged_jobs']:>11.1f}"
+        )
+
+    per_job, batched = results["per_job"], results["batched"]
+    if per_job["prompt_tokens"]:
+        saved = (per_job["prompt_tokens"] - batched["prompt_tokens"]) / per_job["prompt_tokens"] * 100
+        print(f"\nbatched: {saved:.1f}% fewer prompt tokens, "
+              f"{per_job['latency_p50_s'] - batched['latency_p50_s']:+.2f} s p50 latency saved")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=5, help="work experiences in the sample resume")
+    parser.add_argument("--bullets", type=int, default=4, help="achievements per job")
+    parser.add_argument("--rounds", type=int, default=3, help="runs per path")
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(measure(args.jobs, args.bullets, args.rounds))
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "model": main_backup.OPENAI_MODEL,
+                "jobs": args.jobs,
+                "bullets": args.bullets,
+                "rounds": args.rounds,
+                "max_concurrency": main_backup.OPENAI_MAX_CONCURRENCY,
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
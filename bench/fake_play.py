@@ -0,0 +1,424 @@
+"""
+Local fake of the Google Play Developer API (and its OAuth token endpoint)
+
+Serves purchases.subscriptions.get / acknowledge from a seeded token catalog
+with configurable latency and fault injection, so timeouts, retries and
+caching can be exercised offline. Point the app at it with:
+
+    GOOGLE_PLAY_API_BASE_URL=http://127.0.0.1:18081
+
+and a service account whose token_uri is http://127.0.0.1:18081/token
+(bench.loadtest generates one).
+
+    python -m bench.fake_play --port 18081 --seed 7 --catalog-size 1000 \\
+        --latency lognormal:40:0.5 --error-rate 429=0.02 --error-rate 503=0.01 --max-rps 200
+
+Settings can also come from FAKE_PLAY_* environment variables when the app
+is started directly (uvicorn bench.fake_play:app), and be changed at runtime
+with PUT /_fake/config.
+
+Catalog tokens are named fake-token-N. Tokens that are not in the catalog
+either 404 (--unknown-tokens missing) or are answered as active
+subscriptions (--unknown-tokens active, the default, so arbitrary load-test
+tokens verify).
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import time
+from typing import Dict, Optional
+
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+
+DAY_MS = 24 * 3600 * 1000
+
+# Subscription states a catalog entry can be in, with the default seeding mix
+STATE_MIX = {
+    "active": 0.80,
+    "expired": 0.08,
+    "canceled": 0.05,   # auto-renew off, still inside the paid period
+    "pending": 0.02,    # paymentState 0
+    "revoked": 0.03,    # 410 Gone
+    "missing": 0.02,    # 404 Not Found
+}
+
+ERROR_STATUS = {
+    404: "NOT_FOUND",
+    410: "GONE",
+    429: "RESOURCE_EXHAUSTED",
+    500: "INTERNAL",
+    502: "BAD_GATEWAY",
+    503: "UNAVAILABLE",
+    504: "DEADLINE_EXCEEDED",
+}
+
+
+# ==================== Configuration ====================
+
+class Latency:
+    """
+    Latency distribution parsed from a spec string (milliseconds):
+
+        fixed:20  uniform:10:80  normal:50:15  lognormal:40:0.5 (median, sigma)
+    """
+
+    def __init__(self, spec: str):
+        kind, *params = spec.split(":")
+        self.spec = spec
+        self.kind = kind
+        self.params = [float(p) for p in params]
+        expected = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+        if kind not in expected or len(self.params) != expected[kind]:
+            raise ValueError(f"Invalid latency spec {spec!r}")
+
+    def sample(self, rng: random.Random) -> float:
+        """Seconds to wait before answering"""
+        p = self.params
+        if self.kind == "fixed":
+            ms = p[0]
+        elif self.kind == "uniform":
+            ms = rng.uniform(p[0], p[1])
+        elif self.kind == "normal":
+            ms = rng.gauss(p[0], p[1])
+        else:
+            ms = rng.lognormvariate(math.log(p[0]), p[1])
+        return max(ms, 0) / 1000
+
+
+class TokenBucket:
+    """Requests-per-second throttle; an empty bucket answers 429"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def take(self) -> Optional[float]:
+        """Consume one token, or return seconds until one is available"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return None
+        return (1 - self.tokens) / self.rate
+
+
+class FakePlayConfig:
+    def __init__(
+        self,
+        seed: int = 0,
+        catalog_size: int = 1000,
+        catalog_file: Optional[str] = None,
+        latency: str = "fixed:0",
+        ack_latency: Optional[str] = None,
+        error_rates: Optional[Dict[int, float]] = None,
+        max_rps: float = 0,
+        burst: Optional[float] = None,
+        unknown_tokens: str = "active",
+        product_id: str = "prostack_premium",
+    ):
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.latency = Latency(latency)
+        self.ack_latency = Latency(ack_latency) if ack_latency else self.latency
+        self.error_rates = error_rates or {}
+        self.throttle = TokenBucket(max_rps, burst) if max_rps > 0 else None
+        self.unknown_tokens = unknown_tokens
+        self.product_id = product_id
+
+        if catalog_file:
+            with open(catalog_file) as f:
+                self.catalog = json.load(f)
+        else:
+            self.catalog = generate_catalog(seed, catalog_size, product_id)
+
+    @classmethod
+    def from_env(cls) -> "FakePlayConfig":
+        return cls(
+            seed=int(os.getenv("FAKE_PLAY_SEED", "0")),
+            catalog_size=int(os.getenv("FAKE_PLAY_CATALOG_SIZE", "1000")),
+            catalog_file=os.getenv("FAKE_PLAY_CATALOG"),
+            latency=os.getenv("FAKE_PLAY_LATENCY", "fixed:0"),
+            ack_latency=os.getenv("FAKE_PLAY_ACK_LATENCY"),
+            error_rates=parse_error_rates(os.getenv("FAKE_PLAY_ERROR_RATES", "").split(",")),
+            max_rps=float(os.getenv("FAKE_PLAY_MAX_RPS", "0")),
+            burst=float(os.getenv("FAKE_PLAY_BURST", "0")) or None,
+            unknown_tokens=os.getenv("FAKE_PLAY_UNKNOWN_TOKENS", "active"),
+        )
+
+    def describe(self) -> dict:
+        return {
+            "seed": self.seed,
+            "catalog_size": len(self.catalog),
+            "latency": self.latency.spec,
+            "ack_latency": self.ack_latency.spec,
+            "error_rates": {str(code): rate for code, rate in self.error_rates.items()},
+            "max_rps": self.throttle.rate if self.throttle else 0,
+            "unknown_tokens": self.unknown_tokens,
+        }
+
+
+def parse_error_rates(items) -> Dict[int, float]:
+    """["429=0.02", "503=0.01"] -> {429: 0.02, 503: 0.01}"""
+    rates = {}
+    for item in items:
+        if not item.strip():
+            continue
+        code, rate = item.split("=")
+        rates[int(code)] = float(rate)
+    if sum(rates.values()) > 1:
+        raise ValueError("Error rates add up to more than 1")
+    return rates
+
+
+def generate_catalog(seed: int, size: int, product_id: str) -> Dict[str, dict]:
+    """Deterministic token catalog: the same seed always yields the same states"""
+    rng = random.Random(seed)
+    states, weights = zip(*STATE_MIX.items())
+    now_ms = int(time.time() * 1000)
+    catalog = {}
+
+    for i in range(size):
+        state = rng.choices(states, weights)[0]
+        start_ms = now_ms - rng.randint(1, 300) * DAY_MS
+        if state == "expired":
+            expiry_ms = now_ms - rng.randint(1, 60) * DAY_MS
+        else:
+            expiry_ms = now_ms + rng.randint(1, 30) * DAY_MS
+        catalog[f"fake-token-{i}"] = {
+            "product_id": product_id,
+            "state": state,
+            "start_ms": start_ms,
+            "expiry_ms": expiry_ms,
+            "acknowledged": rng.random() < 0.9,
+        }
+    return catalog
+
+
+# ==================== Responses ====================
+
+def google_error(code: int, message: str, headers: Optional[dict] = None) -> JSONResponse:
+    """Error body in the shape googleapis returns"""
+    return JSONResponse(
+        {"error": {"code": code, "message": message, "status": ERROR_STATUS.get(code, "UNKNOWN")}},
+        status_code=code,
+        headers=headers,
+    )
+
+
+def subscription_resource(token: str, entry: dict) -> dict:
+    state = entry["state"]
+    resource = {
+        "kind": "androidpublisher#subscriptionPurchase",
+        "orderId": f"GPA.fake-{abs(hash(token)) % 10**16:016d}",
+        "startTimeMillis": str(entry["start_ms"]),
+        "expiryTimeMillis": str(entry["expiry_ms"]),
+        "autoRenewing": state == "active",
+        "priceCurrencyCode": "USD",
+        "priceAmountMicros": "4990000",
+        "countryCode": "US",
+        "paymentState": 0 if state == "pending" else 1,
+        "acknowledgementState": 1 if entry["acknowledged"] else 0,
+    }
+    if state == "canceled":
+        resource["cancelReason"] = 0
+        resource["userCancellationTimeMillis"] = str(entry["start_ms"] + DAY_MS)
+    return resource
+
+
+def default_entry(product_id: str) -> dict:
+    now_ms = int(time.time() * 1000)
+    return {
+        "product_id": product_id,
+        "state": "active",
+        "start_ms": now_ms - DAY_MS,
+        "expiry_ms": now_ms + 30 * DAY_MS,
+        "acknowledged": True,
+    }
+
+
+# ==================== App ====================
+
+app = FastAPI(title="Fake Google Play Developer API")
+app.state.config = FakePlayConfig.from_env()
+app.state.counters = {}
+
+
+def count(key: str):
+    app.state.counters[key] = app.state.counters.get(key, 0) + 1
+
+
+async def inject(latency: Latency) -> Optional[JSONResponse]:
+    """Apply throttling, latency and random faults; returns a response to short-circuit with"""
+    config: FakePlayConfig = app.state.config
+
+    if config.throttle is not None:
+        retry_after = config.throttle.take()
+        if retry_after is not None:
+            count("throttled")
+            return google_error(
+                429, "Rate limit exceeded", headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+            )
+
+    await asyncio.sleep(latency.sample(config.rng))
+
+    roll = config.rng.random()
+    for code, rate in config.error_rates.items():
+        if roll < rate:
+            count(f"injected_{code}")
+            headers = {"Retry-After": "1"} if code in (429, 503) else None
+            return google_error(code, f"Injected {code}", headers=headers)
+        roll -= rate
+    return None
+
+
+def lookup(subscription_id: str, token: str):
+    """Catalog entry for a token, or an error response"""
+    config: FakePlayConfig = app.state.config
+    entry = config.catalog.get(token)
+
+    if entry is None:
+        if config.unknown_tokens != "active":
+            return None, google_error(404, "The purchase token was not found.")
+        entry = config.catalog.setdefault(token, default_entry(subscription_id))
+
+    if entry["product_id"] != subscription_id or entry["state"] == "missing":
+        return None, google_error(404, "The purchase token was not found.")
+    if entry["state"] == "revoked":
+        return None, google_error(410, "The subscription purchase is no longer available for query because it has been expired for too long.")
+    return entry, None
+
+
+@app.post("/token")
+async def token(request: Request):
+    """OAuth2 JWT-bearer exchange used by google-auth service accounts (never faulted)"""
+    await request.body()
+    count("token")
+    return {"access_token": "fake-access-token", "token_type": "Bearer", "expires_in": 3600}
+
+
+@app.get("/applications/{package}/purchases/subscriptions/{subscription_id}/tokens/{token}")
+async def get_subscription(package: str, subscription_id: str, token: str):
+    count("get")
+    error = await inject(app.state.config.latency)
+    if error is not None:
+        return error
+
+    entry, error = lookup(subscription_id, token)
+    if error is not None:
+        count(f"get_{error.status_code}")
+        return error
+    return subscription_resource(token, entry)
+
+
+@app.post("/applications/{package}/purchases/subscriptions/{subscription_id}/tokens/{token}:acknowledge")
+async def acknowledge(package: str, subscription_id: str, token: str):
+    count("acknowledge")
+    error = await inject(app.state.config.ack_latency)
+    if error is not None:
+        return error
+
+    entry, error = lookup(subscription_id, token)
+    if error is not None:
+        return error
+    if entry["acknowledged"]:
+        return google_error(400, "The subscription purchase has already been acknowledged.")
+
+    entry["acknowledged"] = True
+    return Response(status_code=204)
+
+
+@app.get("/_fake/config")
+async def get_config():
+    return {**app.state.config.describe(), "counters": app.state.counters}
+
+
+@app.put("/_fake/config")
+async def put_config(request: Request):
+    """Swap latency / fault settings mid-run; the catalog is kept unless reseeded"""
+    body = await request.json()
+    current: FakePlayConfig = app.state.config
+
+    catalog = current.catalog
+    if "seed" in body or "catalog_size" in body:
+        catalog = None
+
+    config = FakePlayConfig(
+        seed=body.get("seed", current.seed),
+        catalog_size=body.get("catalog_size", len(current.catalog)),
+        latency=body.get("latency", current.latency.spec),
+        ack_latency=body.get("ack_latency", current.ack_latency.spec),
+        error_rates={int(k): float(v) for k, v in body["error_rates"].items()}
+        if "error_rates" in body else current.error_rates,
+        max_rps=body.get("max_rps", current.throttle.rate if current.throttle else 0),
+        burst=body.get("burst"),
+        unknown_tokens=body.get("unknown_tokens", current.unknown_tokens),
+        product_id=current.product_id,
+    )
+    if catalog is not None:
+        config.catalog = catalog
+
+    app.state.config = config
+    app.state.counters = {}
+    return config.describe()
+
+
+@app.get("/_fake/catalog")
+async def get_catalog(state: Optional[str] = None, limit: int = 100):
+    """Catalog tokens (optionally filtered by state) for building test inputs"""
+    tokens = [
+        {"token": token, **entry}
+        for token, entry in app.state.config.catalog.items()
+        if state is None or entry["state"] == state
+    ]
+    return tokens[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18081)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--catalog-size", type=int, default=1000)
+    parser.add_argument("--catalog", help="JSON catalog file instead of a generated one")
+    parser.add_argument("--latency", default="fixed:0", help="e.g. fixed:20, uniform:10:80, lognormal:40:0.5")
+    parser.add_argument("--ack-latency")
+    parser.add_argument("--error-rate", action="append", default=[], help="CODE=RATE, repeatable")
+    parser.add_argument("--max-rps", type=float, default=0, help="throttle with 429 above this rate")
+    parser.add_argument("--burst", type=float)
+    parser.add_argument("--unknown-tokens", choices=("active", "missing"), default="active")
+    parser.add_argument("--dump-catalog", help="write the generated catalog to this file and exit")
+    args = parser.parse_args()
+
+    config = FakePlayConfig(
+        seed=args.seed,
+        catalog_size=args.catalog_size,
+        catalog_file=args.catalog,
+        latency=args.latency,
+        ack_latency=args.ack_latency,
+        error_rates=parse_error_rates(args.error_rate),
+        max_rps=args.max_rps,
+        burst=args.burst,
+        unknown_tokens=args.unknown_tokens,
+    )
+
+    if args.dump_catalog:
+        with open(args.dump_catalog, "w") as f:
+            json.dump(config.catalog, f, indent=2)
+        return
+
+    import uvicorn
+
+    app.state.config = config
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
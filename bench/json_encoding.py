@@ -0,0 +1,150 @@
+"""
+Per-request JSON encoding cost: FastAPI defaults vs orjson vs pre-encoded
+
+Times the work FastAPI does after a handler returns, for payloads shaped
+like ours:
+
+- default       jsonable_encoder + JSONResponse (stdlib json), FastAPI's default
+- orjson        jsonable_encoder + ORJSONResponse (default_response_class only)
+- orjson_direct ORJSONResponse returned from the handler (no jsonable_encoder)
+- pre_encoded   Response with bytes built once at startup (constant payloads)
+
+    python -m bench.json_encoding
+    python -m bench.json_encoding --number 20000 --output json_encoding.json
+"""
+
+import argparse
+import json
+import platform
+import timeit
+from datetime import datetime, timedelta
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
+
+
+def products_payload() -> dict:
+    products = [
+        ("prostack_premium", "Premium Monthly", "premium", "monthly", 4.99),
+        ("prostack_premium_yearly", "Premium Yearly", "premium", "yearly", 29.99),
+        ("prostack_business", "Business Monthly", "business", "monthly", 9.99),
+        ("prostack_business_yearly", "Business Yearly", "business", "yearly", 59.99),
+    ]
+    return {
+        "success": True,
+        "products": [
+            {"product_id": p, "name": n, "tier": t, "billing_period": b, "price": price, "currency": "USD"}
+            for p, n, t, b, price in products
+        ],
+    }
+
+
+def license_check_payload() -> dict:
+    now = datetime.now()
+    return {
+        "success": True,
+        "valid": True,
+        "tier": "premium",
+        "is_active": True,
+        "expiry_date": now + timedelta(days=30),
+        "message": "License valid",
+    }
+
+
+def resume_payload(jobs: int = 6) -> dict:
+    """resume_data as built by /api/v1/resume/generate, for a long resume"""
+    experience = [
+        {
+            "company": f"Company {i}",
+            "title": "Senior Software Engineer",
+            "start_date": f"{2010 + i}-01",
+            "end_date": None if i == 0 else f"{2011 + i}-06",
+            "current": i == 0,
+            "responsibilities": [f"Owned service {j} end to end, from design to on-call" for j in range(5)],
+            "achievements": [
+                f"Reduced p99 latency of checkout by {10 + j}% by rewriting the pricing cache layer" for j in range(6)
+            ],
+        }
+        for i in range(jobs)
+    ]
+    return {
+        "success": True,
+        "resume_data": {
+            "personal_info": {
+                "name": "Alex Example",
+                "email": "alex@example.com",
+                "phone": "+1 555 0100",
+                "location": "Austin, TX",
+                "linkedin": "https://linkedin.com/in/alex-example",
+                "portfolio": None,
+            },
+            "summary": "Backend engineer with a decade of experience building payment systems. " * 4,
+            "work_experience": experience,
+            "education": [{"institution": "State University", "degree": "BSc", "field": "Computer Science",
+                           "graduation_date": "2009-05", "gpa": "3.8", "honors": ["Cum Laude"]}],
+            "skills": [{"name": f"Skill {i}", "level": "Expert"} for i in range(25)],
+            "projects": [],
+            "certifications": [],
+            "template": "modern",
+            "generated_at": datetime.utcnow().isoformat(),
+        },
+        "suggestions": ["Add quantifiable metrics to achievements"] * 3,
+        "ats_score": 87,
+        "keywords": [f"keyword{i}" for i in range(20)],
+    }
+
+
+PAYLOADS = {
+    "products": products_payload,
+    "license_check": license_check_payload,
+    "resume_generate": resume_payload,
+}
+
+
+def strategies(payload: dict) -> dict:
+    pre_encoded = orjson.dumps(payload)
+    return {
+        "default": lambda: JSONResponse(jsonable_encoder(payload)).body,
+        "orjson": lambda: ORJSONResponse(jsonable_encoder(payload)).body,
+        "orjson_direct": lambda: ORJSONResponse(payload).body,
+        "pre_encoded": lambda: Response(pre_encoded, media_type="application/json").body,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=5000, help="calls per measurement")
+    parser.add_argument("--repeat", type=int, default=5, help="measurements (best is reported)")
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    results = {}
+    for name, build in PAYLOADS.items():
+        payload = build()
+        # Same bytes on the wire, modulo whitespace
+        assert json.loads(JSONResponse(jsonable_encoder(payload)).body) == json.loads(ORJSONResponse(payload).body)
+
+        timings = {}
+        for strategy, fn in strategies(payload).items():
+            best = min(timeit.repeat(fn, number=args.number, repeat=args.repeat))
+            timings[strategy] = round(best / args.number * 1e6, 2)  # µs per response
+
+        baseline = timings["default"]
+        results[name] = {
+            "bytes": len(orjson.dumps(payload)),
+            "us_per_response": timings,
+            "cpu_saved_pct": {k: round((baseline - v) / baseline * 100, 1) for k, v in timings.items()},
+        }
+
+        print(f"\n{name} ({results[name]['bytes']} bytes)")
+        for strategy, us in timings.items():
+            print(f"  {strategy:<15}{us:>9.2f} µs   {results[name]['cpu_saved_pct'][strategy]:>6.1f}% saved")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"python": platform.python_version(), "number": args.number, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Gunicorn settings for serving app.main with several Uvicorn worker processes
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+WEB_CONCURRENCY          worker processes (default: usable CPUs, at most 4)
+DB_MAX_CONNECTIONS       Postgres connections the whole service may hold;
+                         split across workers and their two pools unless
+                         DB_POOL_* / SQLA_* are set explicitly
+SHARED_CACHE_URL         redis:// URL so workers share license/verification
+                         caches; without it each worker caches on its own
+GRACEFUL_TIMEOUT         seconds a worker gets to finish in-flight requests
+MAX_REQUESTS             recycle a worker after this many requests (0 = never)
+
+Graceful restarts: `kill -HUP <master pid>` starts fresh workers and lets
+the old ones drain; SIGTERM (what Railway sends on deploy) drains and exits.
+"""
+
+import logging
+import multiprocessing
+import os
+import glob
+import tempfile
+
+
+def _usable_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return multiprocessing.cpu_count()
+
+
+workers = int(os.getenv("WEB_CONCURRENCY") or min(_usable_cpus(), 4))
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+max_requests = int(os.getenv("MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "0")) or max_requests // 10
+
+# Request logging is done by the app (JSON, with request IDs)
+accesslog = None
+errorlog = "-"
+
+# ==================== Per-worker Database Pools ====================
+
+# Each worker has the psycopg pool (license endpoints) and the SQLAlchemy
+# pool (router); together they must fit the connection budget
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "20"))
+
+_per_worker = max(2, DB_MAX_CONNECTIONS // workers)
+_psycopg_share = max(1, _per_worker * 2 // 3)
+os.environ.setdefault("DB_POOL_MAX_SIZE", str(_psycopg_share))
+os.environ.setdefault("DB_POOL_MIN_SIZE", str(min(2, _psycopg_share)))
+os.environ.setdefault("SQLA_POOL_SIZE", str(max(1, _per_worker - _psycopg_share)))
+os.environ.setdefault("SQLA_MAX_OVERFLOW", "0")
+
+# ==================== Cross-worker State ====================
+
+if not os.getenv("SHARED_CACHE_URL") and workers > 1:
+    # Another worker's write can't reach this worker's cache, so keep the
+    # window in which a stale license can be served short
+    os.environ.setdefault("LICENSE_CACHE_TTL", "10")
+
+# Counters and histograms are aggregated across workers from these files
+_metrics_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+if not _metrics_dir:
+    _metrics_dir = os.path.join(tempfile.gettempdir(), "prostack-metrics")
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = _metrics_dir
+
+
+def on_starting(server):
+    # Files left over from a previous run would be summed into the new one.
+    # Only the metric files go: the directory may be shared (e.g. /tmp)
+    os.makedirs(_metrics_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(_metrics_dir, "*.db")):
+        os.remove(path)
+
+    log = logging.getLogger("gunicorn.error")
+    log.info(
+        "Starting %s workers; per worker: psycopg pool %s, SQLAlchemy pool %s+%s, shared cache %s",
+        workers,
+        os.environ["DB_POOL_MAX_SIZE"],
+        os.environ["SQLA_POOL_SIZE"],
+        os.environ["SQLA_MAX_OVERFLOW"],
+        "redis" if os.getenv("SHARED_CACHE_URL") else "off (per-worker)",
+    )
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,106 @@
+"""
+Import-time report for the API entry points
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter and
+summarises where the cold-start time goes, grouped by top-level package.
+With --budget-ms the exit status is non-zero when the total exceeds the
+budget, so CI can keep startup cost from creeping back up.
+
+    python tools/importtime.py                       # app.main
+    python tools/importtime.py app.main_backup --top 15
+    python tools/importtime.py --budget-ms 1500 --json importtime.json
+
+Run from the repository root. Placeholder DATABASE_URL / OPENAI_API_KEY
+values are set when missing; nothing connects during import.
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+PLACEHOLDER_ENV = {
+    "DATABASE_URL": "postgresql://importtime@localhost/importtime",
+    "OPENAI_API_KEY": "sk-importtime",
+}
+
+
+def measure(module: str) -> list:
+    """[(module, self_us, cumulative_us, depth)] in import order"""
+    env = {**PLACEHOLDER_ENV, **os.environ}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        sys.exit(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return entries
+
+
+def summarise(module: str, entries: list, top: int) -> dict:
+    # Top-level imports (depth 0) add up to the whole import
+    total_us = sum(cumulative for _, _, cumulative, depth in entries if depth == 0)
+
+    by_package = defaultdict(int)
+    for name, self_us, _, _ in entries:
+        by_package[name.split(".")[0]] += self_us
+
+    packages = sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top]
+    slowest = sorted(entries, key=lambda entry: entry[1], reverse=True)[:top]
+
+    return {
+        "module": module,
+        "python": sys.version.split()[0],
+        "total_ms": round(total_us / 1000, 1),
+        "modules_imported": len(entries),
+        "packages_ms": {name: round(us / 1000, 1) for name, us in packages},
+        "slowest_modules_ms": {name: round(self_us / 1000, 1) for name, self_us, _, _ in slowest},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("module", nargs="?", default="app.main")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, help="fail when the import takes longer than this")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    report = summarise(args.module, measure(args.module), args.top)
+
+    print(f"import {report['module']}: {report['total_ms']} ms, {report['modules_imported']} modules")
+    print("\nBy package (self time):")
+    for name, ms in report["packages_ms"].items():
+        print(f"  {name:<32}{ms:>10.1f} ms")
+    print("\nSlowest modules (self time):")
+    for name, ms in report["slowest_modules_ms"].items():
+        print(f"  {name:<48}{ms:>10.1f} ms")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2))
+
+    if args.budget_ms is not None and report["total_ms"] > args.budget_ms:
+        print(f"\nOver budget: {report['total_ms']} ms > {args.budget_ms} ms", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Replay Google Play real-time developer notifications against a local server
+
+Feeds recorded notifications to /api/v1/rtdn/push the way a Pub/Sub push
+subscription would. Input is JSON Lines; each line is either a full push
+envelope ({"message": {"data": ..., "messageId": ...}}) or a bare
+DeveloperNotification ({"packageName": ..., "subscriptionNotification": ...}),
+which gets wrapped with a deterministic messageId.
+
+    python tools/replay_rtdn.py recorded.jsonl --url http://127.0.0.1:8080
+    python tools/replay_rtdn.py recorded.jsonl --repeat 3 --shuffle   # redelivery, reordering
+    python tools/replay_rtdn.py --generate 500 --seed 7 > synthetic.jsonl
+
+--generate writes notifications for the fake-token-N tokens served by
+bench.fake_play, so the whole flow can run offline.
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import sys
+import time
+from collections import Counter
+from typing import List
+
+import httpx
+
+PACKAGE_NAME = "com.fourdgamimg.prostack"
+PRODUCTS = ["prostack_premium", "prostack_premium_yearly", "prostack_business", "prostack_business_yearly"]
+
+# notificationType -> relative frequency in generated traffic
+GENERATED_TYPES = {
+    2: 0.50,   # RENEWED
+    4: 0.15,   # PURCHASED
+    3: 0.10,   # CANCELED
+    13: 0.10,  # EXPIRED
+    1: 0.05,   # RECOVERED
+    5: 0.04,   # ON_HOLD
+    6: 0.03,   # IN_GRACE_PERIOD
+    12: 0.03,  # REVOKED
+}
+
+
+def envelope(notification: dict, message_id: str = None) -> dict:
+    """Wrap a DeveloperNotification the way Pub/Sub push delivers it"""
+    data = json.dumps(notification, separators=(",", ":")).encode()
+    if message_id is None:
+        message_id = str(int(hashlib.sha256(data).hexdigest()[:15], 16))
+    return {
+        "message": {
+            "data": base64.b64encode(data).decode(),
+            "messageId": message_id,
+            "publishTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+        "subscription": "projects/local/subscriptions/play-rtdn-replay",
+    }
+
+
+def load(path: str) -> List[dict]:
+    messages = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            messages.append(item if "message" in item else envelope(item))
+    return messages
+
+
+def generate(count: int, seed: int, tokens: int) -> List[dict]:
+    """Synthetic notifications with increasing event times per token"""
+    rng = random.Random(seed)
+    types, weights = zip(*GENERATED_TYPES.items())
+    now_ms = int(time.time() * 1000)
+    notifications = []
+
+    for i in range(count):
+        token = rng.randrange(tokens)
+        notifications.append({
+            "version": "1.0",
+            "packageName": PACKAGE_NAME,
+            "eventTimeMillis": str(now_ms - (count - i) * 1000),
+            "subscriptionNotification": {
+                "version": "1.0",
+                "notificationType": rng.choices(types, weights)[0],
+                "purchaseToken": f"fake-token-{token}",
+                "subscriptionId": PRODUCTS[token % len(PRODUCTS)],
+            },
+        })
+    return notifications
+
+
+async def replay(messages: List[dict], url: str, push_token: str, concurrency: int) -> Counter:
+    statuses: Counter = Counter()
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    params = {"token": push_token} if push_token else None
+
+    async with httpx.AsyncClient(timeout=30) as client:
+
+        async def push(message: dict):
+            async with semaphore:
+                start = time.monotonic()
+                try:
+                    response = await client.post(f"{url}/api/v1/rtdn/push", json=message, params=params)
+                    statuses[str(response.status_code)] += 1
+                except httpx.HTTPError as e:
+                    statuses[type(e).__name__] += 1
+                latencies.append(time.monotonic() - start)
+
+        started = time.monotonic()
+        await asyncio.gather(*(push(message) for message in messages))
+        elapsed = time.monotonic() - started
+
+    latencies.sort()
+    if latencies:
+        print(
+            f"{len(messages)} pushes in {elapsed:.2f}s ({len(messages) / elapsed:.0f}/s), "
+            f"p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+            f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms",
+            file=sys.stderr,
+        )
+    return statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", nargs="?", help="JSON Lines file of recorded notifications")
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--push-token", help="RTDN_PUSH_TOKEN configured on the server")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--repeat", type=int, default=1, help="deliver every message this many times")
+    parser.add_argument("--shuffle", action="store_true", help="deliver in random order")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--generate", type=int, help="print this many synthetic notifications and exit")
+    parser.add_argument("--tokens", type=int, default=1000, help="fake-token-N range for --generate")
+    args = parser.parse_args()
+
+    if args.generate:
+        for notification in generate(args.generate, args.seed, args.tokens):
+            print(json.dumps(notification))
+        return
+
+    if not args.input:
+        parser.error("input file is required unless --generate is given")
+
+    messages = load(args.input) * args.repeat
+    if args.shuffle:
+        random.Random(args.seed).shuffle(messages)
+
+    statuses = asyncio.run(replay(messages, args.url, args.push_token, args.concurrency))
+    print(json.dumps(dict(statuses)))
+    sys.exit(0 if set(statuses) <= {"204"} else 1)
+
+
+if __name__ == "__main__":
+    main()